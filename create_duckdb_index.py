@@ -4,24 +4,51 @@ Script to organize GNU GLOBAL index information into a DuckDB database
 """
 
 import os
+import re
 import sys
+import csv
 import subprocess
+import tempfile
 import duckdb
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 # Database configuration
 DB_FILE = "global_symbols.db"
 TABLE_NAME = "symbol_definitions"
+SEQUENCE_NAME = f"{TABLE_NAME}_id_seq"
+PROCESSED_FILES_TABLE_NAME = "processed_files"
+
+# Number of files passed to a single global invocation
+FILES_PER_GLOBAL_CALL = 256
+
+# Number of symbols collected before they are bulk loaded and committed in one batch
+LOAD_BATCH_ROWS = 50000
+
+# One line of global -x output: symbol, line number, path, line content
+_GTAG_RE = re.compile(rb'(\S+)\s+(\d+)\s+(\S+)\s+(\S.*)')
 
 
 def create_table_if_not_exists(conn: duckdb.DuckDBPyConnection) -> None:
-    """Create table and indexes if they don't exist"""
+    """Create sequence and tables if they don't exist (indexes are created after loading)"""
+    
+    # Create id sequence once; it is persisted in the database, so only the first
+    # run against a table filled without it needs to look up the next id
+    sequence_exists = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_sequences() WHERE sequence_name = ?", [SEQUENCE_NAME]
+    ).fetchone()[0] > 0
+    if not sequence_exists:
+        table_exists = conn.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [TABLE_NAME]
+        ).fetchone()[0] > 0
+        start_id = get_next_id(conn) if table_exists else 1
+        conn.execute(f"CREATE SEQUENCE {SEQUENCE_NAME} START WITH {start_id}")
     
     # Create table
     conn.execute(f"""
         CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
-            id INTEGER PRIMARY KEY,
+            id INTEGER PRIMARY KEY DEFAULT nextval('{SEQUENCE_NAME}'),
             symbol_name VARCHAR NOT NULL,
             file_path VARCHAR NOT NULL,
             line_num_start INTEGER NOT NULL,
@@ -31,108 +58,169 @@ def create_table_if_not_exists(conn: duckdb.DuckDBPyConnection) -> None:
         )
     """)
     
-    # Create indexes (ignore errors if they already exist)
-    try:
-        conn.execute(f"CREATE INDEX idx_symbol_name ON {TABLE_NAME} (symbol_name)")
-    except:
-        pass  # Index already exists
-    
-    try:
-        conn.execute(f"CREATE INDEX idx_file_line_start ON {TABLE_NAME} (file_path, line_num_start)")
-    except:
-        pass
-    
-    try:
-        conn.execute(f"CREATE INDEX idx_file_line_end ON {TABLE_NAME} (file_path, line_num_end)")
-    except:
-        pass
+    # Create table of files whose symbols have been loaded
+    # (filled from symbol_definitions when added to a database created without it)
+    processed_table_exists = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [PROCESSED_FILES_TABLE_NAME]
+    ).fetchone()[0] > 0
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {PROCESSED_FILES_TABLE_NAME} (path VARCHAR PRIMARY KEY)")
+    if not processed_table_exists:
+        conn.execute(f"INSERT INTO {PROCESSED_FILES_TABLE_NAME} SELECT DISTINCT file_path FROM {TABLE_NAME}")
+
+
+def finalize_indexes(conn: duckdb.DuckDBPyConnection) -> None:
+    """Create indexes once the bulk load has finished (skipping ones that already exist)"""
+    print("Creating indexes...")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_symbol_name ON {TABLE_NAME} (symbol_name)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_file_line_start ON {TABLE_NAME} (file_path, line_num_start)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_file_line_end ON {TABLE_NAME} (file_path, line_num_end)")
 
 
 def get_next_id(conn: duckdb.DuckDBPyConnection) -> int:
-    """Get the next ID (monotonically increasing)"""
+    """Get the next ID (used to seed the id sequence)"""
     result = conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {TABLE_NAME}").fetchone()
     return result[0]
 
 
 def get_processed_files(conn: duckdb.DuckDBPyConnection) -> set:
     """Get a set of already processed file paths"""
-    result = conn.execute(f"SELECT DISTINCT file_path FROM {TABLE_NAME}").fetchall()
+    result = conn.execute(f"SELECT path FROM {PROCESSED_FILES_TABLE_NAME}").fetchall()
     return {row[0] for row in result}
 
 
-def find_c_and_h_files(src_dir: Path) -> List[Path]:
-    """Recursively search for C files and header files in the src directory"""
+def mark_files_processed(conn: duckdb.DuckDBPyConnection, file_paths: List[str]) -> None:
+    """Record files whose symbols have been loaded (one statement for the whole list)"""
+    conn.execute(f"INSERT INTO {PROCESSED_FILES_TABLE_NAME} (path) SELECT unnest(?)", [file_paths])
+
+
+def find_c_and_h_files(src_dir: Path) -> List[str]:
+    """Recursively search for C files and header files in the src directory (single os.scandir walk)"""
     files = []
-    for ext in ['*.c', '*.h']:
-        files.extend(src_dir.rglob(ext))
-    return sorted(files)
+    dirs = [str(src_dir)]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.name.endswith(('.c', '.h')):
+                    files.append(entry.path)
+    # Sort by path components, the same order as sorting Path objects
+    return sorted(files, key=lambda path: path.split(os.sep))
 
 
-def parse_global_output(output: str, file_path: str) -> List[Tuple[str, str, int, str]]:
+def parse_global_output(lines: Iterable[bytes], path_map: Dict[bytes, str],
+                        line_re: re.Pattern = _GTAG_RE) -> Iterator[Tuple[str, str, int, str]]:
     """
-    globalコマンドの出力を解析
-    Returns: List of (symbol_name, file_path, line_num, line_content)
+    globalコマンドの出力（バイト列）を1行ずつ解析
+    path_map: path printed by global -> file path stored in the database
+    line_re: pattern of one output line (symbol, line number, path, line content)
+    Yields: (symbol_name, file_path, line_num, line_content)
     """
-    results = []
-    for line in output.strip().split('\n'):
+    for line in lines:
+        line = line.rstrip(b'\r\n')
         if not line:
             continue
         
-        # スペースで分割（最低4要素必要）
-        parts = line.split(None, 3)
-        if len(parts) < 4:
-            print(f"Warning: Skipping malformed line: {line}", file=sys.stderr)
+        # シンボル名・行番号・ファイルパス・行の内容の4要素
+        m = line_re.fullmatch(line)
+        if m is None:
+            print(f"Warning: Skipping malformed line: {line!r}", file=sys.stderr)
             continue
         
-        symbol_name = parts[0]
-        try:
-            line_num = int(parts[1])
-        except ValueError:
-            print(f"Warning: Invalid line number in: {line}", file=sys.stderr)
+        # ファイルパスはコマンドで指定したもの
+        printed_path = m.group(3)
+        file_path = path_map.get(printed_path) or path_map.get(os.path.normpath(printed_path))
+        if file_path is None:
+            print(f"Warning: Skipping line for unexpected file: {line!r}", file=sys.stderr)
             continue
         
-        # parts[2]はファイルパス（コマンドで指定したものと同じはず）
-        # parts[3]以降が行の内容
-        line_content = parts[3]
-        
-        results.append((symbol_name, file_path, line_num, line_content))
-    
-    return results
+        yield (m.group(1).decode('utf-8', 'replace'), file_path, int(m.group(2)),
+               m.group(4).decode('utf-8', 'replace'))
 
 
-def run_global_command(file_path: Path) -> Optional[str]:
-    """Execute global command to get symbol information"""
+def run_global_command(file_paths: List[str]) -> subprocess.Popen:
+    """Start global command for a group of files; symbol information is read from its stdout"""
     try:
         # Execute in directory with GNU GLOBAL index
-        result = subprocess.run(
-            ['global', '-fx', str(file_path)],
-            capture_output=True,
-            text=True,
-            check=True
+        return subprocess.Popen(
+            ['global', '-fx'] + file_paths,
+            stdout=subprocess.PIPE,
+            bufsize=1 << 20
         )
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Error running global command for {file_path}: {e}", file=sys.stderr)
-        return None
     except FileNotFoundError:
         print("Error: 'global' command not found. Please ensure GNU GLOBAL is installed.", file=sys.stderr)
         sys.exit(1)
 
 
-def insert_symbols(conn: duckdb.DuckDBPyConnection, symbols: List[Tuple[str, str, int, str]], 
-                   start_id: int) -> int:
-    """Insert symbol information into database"""
-    current_id = start_id
+def collect_file_symbols(file_paths: List[str]) -> Dict[str, List[Tuple[str, str, int, str]]]:
+    """
+    Run global for a group of files and parse its output as it streams (executed in worker processes)
+    Returns: Dict of file_path -> symbols; files for which the global command failed are left out
+    """
+    # global prints paths relative to the current directory; file_paths all start
+    # with it, so the prefix is sliced off instead of calling os.path.relpath per file
+    cwd_prefix = os.path.join(os.getcwd(), '')
+    relative_paths = [file_path[len(cwd_prefix):] for file_path in file_paths]
     
-    for symbol_name, file_path, line_num, line_content in symbols:
+    # global separates the fields of its output with whitespace, so a path containing
+    # whitespace can only be told apart when its file is queried on its own
+    spaced = [bool(re.search(r'\s', relative_path)) for relative_path in relative_paths]
+    if len(file_paths) > 1 and any(spaced):
+        plain_paths = [file_path for file_path, has_space in zip(file_paths, spaced) if not has_space]
+        symbols_by_file = collect_file_symbols(plain_paths) if plain_paths else {}
+        for file_path, has_space in zip(file_paths, spaced):
+            if has_space:
+                symbols_by_file.update(collect_file_symbols([file_path]))
+        return symbols_by_file
+    
+    path_map = {os.fsencode(relative_path): file_path
+                for relative_path, file_path in zip(relative_paths, file_paths)}
+    line_re = _GTAG_RE
+    if spaced[0]:
+        # Single file: match its known path instead of a whitespace-free field
+        line_re = re.compile(rb'(\S+)\s+(\d+)\s+(' + re.escape(os.fsencode(relative_paths[0])) + rb')\s+(\S.*)')
+    symbols_by_file = {file_path: [] for file_path in file_paths}
+    
+    with run_global_command(relative_paths) as proc:
+        for symbol in parse_global_output(proc.stdout, path_map, line_re):
+            symbols_by_file[symbol[1]].append(symbol)
+    
+    if proc.returncode != 0:
+        if len(file_paths) == 1:
+            print(f"Error running global command for {file_paths[0]}: "
+                  f"exit status {proc.returncode}", file=sys.stderr)
+            return {}
+        
+        # Retry the files one at a time so that a bad file only skips itself
+        print(f"Error running global command for {len(file_paths)} files from {file_paths[0]}: "
+              f"exit status {proc.returncode}; retrying them one by one", file=sys.stderr)
+        symbols_by_file = {}
+        for file_path in file_paths:
+            symbols_by_file.update(collect_file_symbols([file_path]))
+    return symbols_by_file
+
+
+def insert_symbols(conn: duckdb.DuckDBPyConnection, symbols: List[Tuple[str, str, int, str]]) -> None:
+    """Bulk load symbol information into database through a temporary TSV file"""
+    fd, tsv_path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f, delimiter='\t').writerows(symbols)
+        
+        # id is taken explicitly from the sequence so that tables created before
+        # the DEFAULT was added are handled as well; line_num_end/contents use defaults.
+        # The file is read serially so that nextval() hands out ids in file/line order,
+        # which the later processing scripts rely on.
         conn.execute(f"""
             INSERT INTO {TABLE_NAME} 
-            (id, symbol_name, file_path, line_num_start, line_num_end, line_content, contents)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (current_id, symbol_name, file_path, line_num, 0, line_content, ''))
-        current_id += 1
-    
-    return current_id
+            (id, symbol_name, file_path, line_num_start, line_content)
+            SELECT nextval('{SEQUENCE_NAME}'), symbol_name, file_path, line_num_start, line_content
+            FROM read_csv(?, delim = '\t', header = false, quote = '"', escape = '"', parallel = false,
+                          columns = {{'symbol_name': 'VARCHAR', 'file_path': 'VARCHAR',
+                                      'line_num_start': 'INTEGER', 'line_content': 'VARCHAR'}})
+        """, [tsv_path])
+    finally:
+        os.unlink(tsv_path)
 
 
 def main():
@@ -155,50 +243,68 @@ def main():
         if processed_files:
             print(f"Found {len(processed_files)} already processed files. Continuing from where we left off...")
         
-        # Get next ID
-        next_id = get_next_id(conn)
-        
         # Search for C and H files
         files = find_c_and_h_files(src_dir)
         print(f"Found {len(files)} C/H files in {src_dir}")
         
+        # Exclude files that were already processed
+        pending_files = [f for f in files if f not in processed_files]
+        file_groups = [pending_files[i:i + FILES_PER_GLOBAL_CALL]
+                       for i in range(0, len(pending_files), FILES_PER_GLOBAL_CALL)]
+        
         # Process each file
         processed_count = 0
-        skipped_count = 0
+        skipped_count = len(files) - len(pending_files)
         total_symbols = 0
+        pending_symbols = []
+        loaded_files = []
         
-        for file_path in files:
-            file_path_str = str(file_path)
-            
-            # Skip if already processed
-            if file_path_str in processed_files:
-                skipped_count += 1
-                continue
-            
-            print(f"Processing: {file_path_str}")
-            
-            # Execute global command
-            output = run_global_command(file_path)
-            if output is None:
-                continue
-            
-            # Parse output
-            symbols = parse_global_output(output, file_path_str)
-            
-            if symbols:
-                # Insert into database
-                next_id = insert_symbols(conn, symbols, next_id)
-                total_symbols += len(symbols)
-                print(f"  -> Inserted {len(symbols)} symbols")
+        # Load everything inside an explicit transaction that is committed once per
+        # load batch, so an interrupted run resumes after the last committed batch
+        conn.begin()
+        try:
+            # Run global in parallel; database writes stay in this process.
+            # executor.map submits every group up front, so the workers keep running
+            # global while this process is busy loading a batch into DuckDB.
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                for file_group, symbols_by_file in zip(file_groups, executor.map(collect_file_symbols, file_groups)):
+                    for file_path_str in file_group:
+                        print(f"Processing: {file_path_str}")
+                        symbols = symbols_by_file.get(file_path_str)
+                        if symbols is None:
+                            continue
+                        
+                        if symbols:
+                            pending_symbols.extend(symbols)
+                            total_symbols += len(symbols)
+                            print(f"  -> Found {len(symbols)} symbols")
+                        
+                        loaded_files.append(file_path_str)
+                        processed_count += 1
+                        
+                        # Load and checkpoint once enough symbols have been collected
+                        if len(pending_symbols) >= LOAD_BATCH_ROWS:
+                            insert_symbols(conn, pending_symbols)
+                            mark_files_processed(conn, loaded_files)
+                            pending_symbols = []
+                            loaded_files = []
+                            conn.commit()
+                            conn.begin()
             
-            processed_count += 1
+            # Insert remaining symbols
+            if pending_symbols:
+                insert_symbols(conn, pending_symbols)
+            if loaded_files:
+                mark_files_processed(conn, loaded_files)
             
-            # Commit periodically
-            if processed_count % 10 == 0:
-                conn.commit()
+            # Final commit
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         
-        # Final commit
-        conn.commit()
+        # Create indexes after the bulk load
+        finalize_indexes(conn)
         
         print("\n" + "="*50)
         print(f"Processing complete!")
@@ -10,13 +10,21 @@ Script to analyze a C language code tree and store documentation information in
 import duckdb
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 # --- Configuration ---
 DB_FILE = "assistive_info.db"
 TARGET_DIRS = ["src", "contrib"]
 README_SEPARATOR = "\n\n---\n\n"
+HEADER_READ_LIMIT = 16 * 1024  # Header comments are searched for only within this many leading characters
+
+# --- Header comment patterns (compiled once, reused for every file) ---
+_HDR_BLOCK_RE = re.compile(r'/\*(-*)\n(.*?)\n\s*(-*)\*/', re.DOTALL)
+_HDR_SIMPLE_RE = re.compile(r'/\*\s*(.*?)\s*\*/', re.DOTALL)
+_STAR_RE = re.compile(r'^\s*\*\s?')
+_COPY_RE = re.compile(r'copyright', re.IGNORECASE)
 
 def setup_database(conn: duckdb.DuckDBPyConnection):
     """Perform initial setup of database and tables"""
@@ -35,47 +43,33 @@ def setup_database(conn: duckdb.DuckDBPyConnection):
     """)
     print("Database setup complete.")
 
-def extract_header_comment(file_path: Path) -> Optional[str]:
+def extract_header_comment(file_path: str) -> Optional[str]:
     """
     Extract and format C-style block comments from the beginning of a file.
     Returns None if no comment is found or if code appears before the comment.
     """
     try:
-        with file_path.open('r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            data = f.read(HEADER_READ_LIMIT)
     except IOError:
         return None
 
-    comment_lines = []
-    in_comment = False
-
-    for line in lines:
-        stripped_line = line.strip()
-
-        # Exit if code or preprocessor directives appear before comment starts
-        if not in_comment and stripped_line and not stripped_line.startswith('/*'):
-            return None
-
-        if stripped_line.startswith('/*'):
-            in_comment = True
-        
-        if in_comment:
-            comment_lines.append(line)
-
-        if '*/' in stripped_line:
-            break
-    
-    if not comment_lines:
+    # Exit if code or preprocessor directives appear before comment starts
+    start = len(data) - len(data.lstrip())
+    if not data.startswith('/*', start):
         return None
 
-    # Combine entire comment block into one string
-    full_comment = "".join(comment_lines)
+    # Cut out the entire comment block up to the first terminator
+    end = data.find('*/', start + 2)
+    if end < 0:
+        return None
+    full_comment = data[start:end + 2]
     
     # Remove /* and */ and hyphens in between
-    match = re.search(r'/\*(-*)\n(.*?)\n\s*(-*)\*/', full_comment, re.DOTALL)
+    match = _HDR_BLOCK_RE.search(full_comment)
     if not match:
         # For simple /* comment */ format
-        match = re.search(r'/\*\s*(.*?)\s*\*/', full_comment, re.DOTALL)
+        match = _HDR_SIMPLE_RE.search(full_comment)
         if not match:
             return None # Not the expected comment format
         content = match.group(1)
@@ -83,11 +77,11 @@ def extract_header_comment(file_path: Path) -> Optional[str]:
         content = match.group(2)
 
     # Remove leading '*' from each line
-    lines_without_stars = [re.sub(r'^\s*\*\s?', '', line) for line in content.splitlines()]
+    lines_without_stars = [_STAR_RE.sub('', line) for line in content.splitlines()]
     
     # ★★★ Modified Section ★★★
     # Remove lines containing "Copyright" (case insensitive)
-    final_lines = [line for line in lines_without_stars if 'copyright' not in line.lower()]
+    final_lines = [line for line in lines_without_stars if not _COPY_RE.search(line)]
 
     # Generate final string
     final_comment = "\n".join(final_lines).strip()
@@ -95,6 +89,11 @@ def extract_header_comment(file_path: Path) -> Optional[str]:
     # Return None if comment becomes empty after removing Copyright lines
     return final_comment if final_comment else None
 
+def extract_header_comment_worker(source_file: Tuple[str, str]) -> Tuple[str, Optional[str]]:
+    """Extract the header comment of one file (executed in worker processes)"""
+    file_path, relative_file_path = source_file
+    return relative_file_path, extract_header_comment(file_path)
+
 def process_directory(base_path: Path, conn: duckdb.DuckDBPyConnection):
     """Process the specified directory recursively"""
     if not base_path.is_dir():
@@ -103,45 +102,68 @@ def process_directory(base_path: Path, conn: duckdb.DuckDBPyConnection):
 
     print(f"Processing directory: {base_path}...")
     
-    cwd = Path.cwd()
+    # Relative paths are made by stripping this prefix from the os.walk strings
+    # instead of calling Path.relative_to() for every directory and file
+    cwd_prefix = os.path.join(str(Path.cwd()), '')
+
+    # Column values are collected during the walk and upserted in one batch per table
+    dir_paths = []
+    readme_contents = []
+    source_files = []
 
     for dirpath, _, filenames in os.walk(base_path):
-        current_dir = Path(dirpath)
-        relative_dir_path = current_dir.relative_to(cwd).as_posix()
+        relative_dir_path = dirpath[len(cwd_prefix):].replace(os.sep, '/')
 
-        # --- README file processing ---
-        readme_files = sorted([
-            f for f in filenames if f.lower().startswith('readme')
-        ])
+        # Split README files and .c/.h files in a single pass over the directory
+        readme_files = []
+        source_filenames = []
+        for filename in filenames:
+            if filename.lower().startswith('readme'):
+                readme_files.append(filename)
+            if filename.endswith(('.c', '.h')):
+                source_filenames.append(filename)
 
+        # --- README file processing ---
         if readme_files:
+            readme_files.sort()
             all_readme_contents = []
             for fname in readme_files:
+                readme_path = os.path.join(dirpath, fname)
                 try:
-                    content = (current_dir / fname).read_text(encoding='utf-8', errors='ignore')
-                    all_readme_contents.append(content)
+                    with open(readme_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        all_readme_contents.append(f.read())
                 except Exception as e:
-                    print(f"Warning: Could not read {current_dir / fname}: {e}")
+                    print(f"Warning: Could not read {readme_path}: {e}")
             
             if all_readme_contents:
-                aggregated_content = README_SEPARATOR.join(all_readme_contents)
-                conn.execute(
-                    "INSERT INTO dir_info (path, readme_contents) VALUES (?, ?) ON CONFLICT(path) DO UPDATE SET readme_contents = excluded.readme_contents",
-                    (relative_dir_path, aggregated_content)
-                )
+                dir_paths.append(relative_dir_path)
+                readme_contents.append(README_SEPARATOR.join(all_readme_contents))
 
         # --- .c, .h file processing ---
-        for filename in filenames:
-            if filename.endswith(('.c', '.h')):
-                file_path = current_dir / filename
-                relative_file_path = file_path.relative_to(cwd).as_posix()
-                
-                comment = extract_header_comment(file_path)
-                if comment:
-                    conn.execute(
-                        "INSERT INTO file_info (path, header_comment) VALUES (?, ?) ON CONFLICT(path) DO UPDATE SET header_comment = excluded.header_comment",
-                        (relative_file_path, comment)
-                    )
+        for filename in source_filenames:
+            source_files.append((os.path.join(dirpath, filename), f"{relative_dir_path}/{filename}"))
+
+    # Header comments are extracted in parallel; database writes stay in this process
+    file_paths = []
+    header_comments = []
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for relative_file_path, comment in executor.map(extract_header_comment_worker, source_files, chunksize=64):
+            if comment:
+                file_paths.append(relative_file_path)
+                header_comments.append(comment)
+
+    # Each table is upserted with one statement: the columns are bound as two
+    # LIST parameters and unnested by DuckDB instead of binding values row by row
+    if dir_paths:
+        conn.execute(
+            "INSERT INTO dir_info (path, readme_contents) SELECT unnest(?), unnest(?) ON CONFLICT(path) DO UPDATE SET readme_contents = excluded.readme_contents",
+            (dir_paths, readme_contents)
+        )
+    if file_paths:
+        conn.execute(
+            "INSERT INTO file_info (path, header_comment) SELECT unnest(?), unnest(?) ON CONFLICT(path) DO UPDATE SET header_comment = excluded.header_comment",
+            (file_paths, header_comments)
+        )
 
 def main():
     """Main processing"""
@@ -3,26 +3,36 @@
 Script to organize symbol reference relationships into a CSV file using GNU GLOBAL's reference information
 """
 
+import os
+import re
 import sys
-import csv
+import tempfile
 import subprocess
 import duckdb
+from tqdm import tqdm
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from operator import itemgetter
 from pathlib import Path
-from typing import Optional, List, Tuple, Set
+from typing import Optional, Dict, Iterable, Iterator, List, Sequence, Tuple, Set
 
 # Database configuration
 DB_FILE = "global_symbols.db"
 TABLE_NAME = "symbol_definitions"
 OUTPUT_CSV = "symbol_references.csv"
 
+# Leading fields of one line of global -rx output: symbol, line number, path
+_GLOBAL_RX_RE = re.compile(rb'(\S+)\s+(\d+)\s+(\S+)')
 
-def run_global_rx_command(symbol_name: str) -> Optional[str]:
+
+def run_global_rx_command(symbol_name: str) -> Optional[bytes]:
     """Execute global -rx command to get symbol reference information"""
     try:
         result = subprocess.run(
             ['global', '-rx', symbol_name],
             capture_output=True,
-            text=True,
             check=False  # Don't treat as error when symbol is not found
         )
         # Return only if there's output
@@ -37,193 +47,259 @@ def run_global_rx_command(symbol_name: str) -> Optional[str]:
         return None
 
 
-def parse_global_rx_output(output: str) -> List[Tuple[str, str, int]]:
+def run_global_rx_all() -> Optional[Dict[str, List[Tuple[str, str, int]]]]:
     """
-    global -rx の出力を解析
-    Returns: List of (symbol_name, file_path, line_num)
+    Execute global -rx once for all symbols and bucket the references by symbol name
+    Returns None if the bulk query is not supported, so callers can fall back to per-symbol calls
     """
-    results = []
-    for line in output.strip().split('\n'):
-        if not line:
-            continue
-        
-        # スペースで分割（最低3要素必要）
-        parts = line.split(None, 3)
-        if len(parts) < 3:
-            continue
-        
-        symbol = parts[0]
-        try:
-            line_num = int(parts[1])
-        except ValueError:
-            continue
-        
-        file_path = parts[2]
-        results.append((symbol, file_path, line_num))
+    try:
+        # Stream the output instead of buffering it, it can be hundreds of MB
+        proc = subprocess.Popen(
+            ['global', '-rx', '.*'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=1 << 20
+        )
+    except FileNotFoundError:
+        print("Error: 'global' command not found. Please ensure GNU GLOBAL is installed.", file=sys.stderr)
+        sys.exit(1)
     
-    return results
+    all_refs = defaultdict(list)
+    with proc:
+        for reference in parse_global_rx_output(proc.stdout):
+            all_refs[reference[0]].append(reference)
+    
+    if proc.returncode != 0:
+        return None
+    return all_refs
 
 
-def find_referencing_symbol_id(conn: duckdb.DuckDBPyConnection, 
-                               file_path: str, 
-                               line_num: int) -> Optional[int]:
+def get_global_tags() -> Optional[Set[str]]:
     """
-    Search for the ID of a symbol definition that contains the specified file path and line number
+    Get the names of all tags defined in GTAGS with global -c
+    Returns None if the command fails
     """
-    # Also consider cases where line_num_end = 0 (to end of file)
-    query = f"""
-        SELECT id 
-        FROM {TABLE_NAME}
-        WHERE file_path = ?
-          AND line_num_start <= ?
-          AND (line_num_end >= ? OR line_num_end = 0)
-        ORDER BY id
-        LIMIT 1
+    try:
+        result = subprocess.run(['global', '-c'], capture_output=True, check=False)
+    except FileNotFoundError:
+        print("Error: 'global' command not found. Please ensure GNU GLOBAL is installed.", file=sys.stderr)
+        sys.exit(1)
+    
+    if result.returncode != 0:
+        return None
+    return {tag.decode('utf-8', 'replace') for tag in result.stdout.split()}
+
+
+def run_global_rx_each(symbol_names: List[str]) -> Dict[str, List[Tuple[str, str, int]]]:
+    """
+    Execute global -rx for each symbol on a thread pool and collect the references by symbol name
+    Used when the bulk query is not supported
     """
+    all_refs = {}
+    
+    # global -rx only reports references to tags defined in GTAGS, so skip the others
+    global_tags = get_global_tags()
+    if global_tags is not None:
+        symbol_names = [symbol_name for symbol_name in symbol_names if symbol_name in global_tags]
+        print(f"  {len(symbol_names)} symbols are defined in GTAGS")
+    
+    # The workers only wait on child processes, so use more threads than CPUs
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+        outputs = executor.map(run_global_rx_command, symbol_names)
+        for symbol_name, output in tqdm(zip(symbol_names, outputs), total=len(symbol_names), desc="Symbols"):
+            if output:
+                all_refs[symbol_name] = list(parse_global_rx_output(output.splitlines()))
     
-    result = conn.execute(query, (file_path, line_num, line_num)).fetchone()
-    if result:
-        return result[0]
-    return None
+    return all_refs
 
 
-def get_symbol_definition_id(conn: duckdb.DuckDBPyConnection, 
-                             symbol_name: str) -> Optional[int]:
+def parse_global_rx_output(lines: Iterable[bytes]) -> Iterator[Tuple[str, str, int]]:
     """
-    Get the minimum ID corresponding to the specified symbol name
+    global -rx の出力（バイト列）を解析
+    Yields: (symbol_name, file_path, line_num)
     """
-    query = f"""
-        SELECT MIN(id) 
-        FROM {TABLE_NAME}
-        WHERE symbol_name = ?
+    # The same symbol names and file paths repeat on many lines; interning them
+    # keeps one string object each in the collected references
+    intern = sys.intern
+    match = _GLOBAL_RX_RE.match
+    for line in lines:
+        # 先頭の3要素のみ使用（行の内容はデコードしない）
+        m = match(line)
+        if m is None:
+            continue
+        
+        symbol, line_num, file_path = m.groups()
+        yield (intern(symbol.decode('utf-8', 'replace')), intern(os.fsdecode(file_path)), int(line_num))
+
+
+def resolve_references(conn: duckdb.DuckDBPyConnection,
+                       referenced_ids: Sequence[int],
+                       file_paths: Sequence[str],
+                       line_nums: Sequence[int]) -> int:
     """
+    Resolve the referencing symbol definition IDs of reference locations, given as
+    parallel referenced_id / file_path / line_num columns, with a single join
+    The locations are staged in a temporary table through a TSV file, and the result is
+    stored in the temporary table refs_out(referencing_id, referenced_id, line_num) in input order
+    Returns: Number of resolved references
+    """
+    if not line_nums:
+        return 0
+    
+    fd, tsv_path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        # Paths parsed from global output contain no whitespace, so the rows are
+        # formatted directly without csv quoting and read back with quoting disabled
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='', buffering=1 << 20) as f:
+            f.writelines(f"{referenced_id}\t{file_path}\t{line_num}\n"
+                         for referenced_id, file_path, line_num in zip(referenced_ids, file_paths, line_nums))
+        
+        # Read serially so that rowid follows the input order
+        conn.execute("""
+            CREATE OR REPLACE TEMP TABLE refs AS
+            SELECT *
+            FROM read_csv(?, delim = '\t', header = false, quote = '', escape = '', parallel = false,
+                          columns = {'referenced_id': 'INTEGER', 'file_path': 'VARCHAR', 'line_num': 'INTEGER'})
+        """, [tsv_path])
+    finally:
+        os.unlink(tsv_path)
     
-    result = conn.execute(query, (symbol_name,)).fetchone()
-    if result and result[0] is not None:
-        return result[0]
-    return None
+    # Copy the columns needed for the range lookup, sorted by location, so that
+    # the row group min/max statistics on file_path and line_num_start are tight
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE defs_sorted AS
+        SELECT id, file_path, line_num_start, line_num_end
+        FROM {TABLE_NAME}
+        ORDER BY file_path, line_num_start
+    """)
+    
+    # The referencing symbol is the definition with the smallest ID containing the line,
+    # line_num_end = 0 means the definition extends to the end of the file
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE refs_out AS
+        WITH referencing AS (
+            SELECT r.rowid AS seq, MIN(d.id) AS referencing_id
+            FROM refs r
+            JOIN defs_sorted d
+              ON d.file_path = r.file_path
+             AND d.line_num_start <= r.line_num
+             AND (d.line_num_end >= r.line_num OR d.line_num_end = 0)
+            GROUP BY r.rowid
+        )
+        SELECT g.referencing_id, r.referenced_id, r.line_num
+        FROM refs r
+        JOIN referencing g ON g.seq = r.rowid
+        ORDER BY r.rowid
+    """)
+    
+    conn.execute("DROP TABLE refs")
+    conn.execute("DROP TABLE defs_sorted")
+    return conn.execute("SELECT COUNT(*) FROM refs_out").fetchone()[0]
 
 
-def process_symbol_references(conn: duckdb.DuckDBPyConnection) -> List[Tuple[int, int, int]]:
+def process_symbol_references(conn: duckdb.DuckDBPyConnection) -> int:
     """
-    Process reference relationships for all symbols
-    Returns: List of (referencing_id, referenced_id, line_num)
+    Process reference relationships for all symbols into the temporary table refs_out
+    Returns: Number of references found
     """
-    references = []
-    
-    # Get unique symbol names (sorted by symbol_name)
-    unique_symbols = conn.execute(f"""
-        SELECT DISTINCT symbol_name 
+    # Get unique symbol names (sorted by symbol_name) with the minimum ID of each,
+    # which is the ID used as the reference target
+    name_to_id = dict(conn.execute(f"""
+        SELECT symbol_name, MIN(id)
         FROM {TABLE_NAME}
+        GROUP BY symbol_name
         ORDER BY symbol_name
-    """).fetchall()
+    """).fetchall())
     
-    total_symbols = len(unique_symbols)
+    total_symbols = len(name_to_id)
     print(f"Processing {total_symbols} unique symbols...")
     
-    processed_count = 0
-    found_references = 0
+    # Fetch the references of all symbols with a single global invocation
+    all_refs = run_global_rx_all()
+    if all_refs is None:
+        print("Bulk 'global -rx' is not supported, falling back to per-symbol queries")
+        all_refs = run_global_rx_each(list(name_to_id))
     
-    for (symbol_name,) in unique_symbols:
-        processed_count += 1
-        
-        # Progress display
-        if processed_count % 100 == 0:
-            print(f"  Progress: {processed_count}/{total_symbols} symbols processed, "
-                  f"{found_references} references found...")
-        
-        # Execute global -rx command
-        output = run_global_rx_command(symbol_name)
-        if not output:
-            continue
-        
-        # Parse output
-        reference_locations = parse_global_rx_output(output)
-        if not reference_locations:
-            continue
-        
-        # Get ID of reference target (definition)
-        referenced_id = get_symbol_definition_id(conn, symbol_name)
-        if referenced_id is None:
-            print(f"  Warning: No definition found for symbol '{symbol_name}'")
-            continue
-        
-        # Process each reference location
-        for _, file_path, line_num in reference_locations:
-            # Search for referencing ID
-            referencing_id = find_referencing_symbol_id(conn, file_path, line_num)
-            
-            if referencing_id is not None:
-                # Option to exclude self-reference (reference within definition)
-                # if referencing_id != referenced_id:
-                references.append((referencing_id, referenced_id, line_num))
-                found_references += 1
+    # Reference locations are kept column-wise; the integer columns are packed
+    # arrays rather than one tuple object per location
+    referenced_ids = array('i')
+    file_paths = []
+    line_nums = array('i')
+    for symbol_name, referenced_id in name_to_id.items():
+        reference_locations = all_refs.get(symbol_name)
+        if reference_locations:
+            referenced_ids.extend(repeat(referenced_id, len(reference_locations)))
+            file_paths.extend(map(itemgetter(1), reference_locations))
+            line_nums.extend(map(itemgetter(2), reference_locations))
+    del all_refs
     
-    print(f"\nProcessing complete: {processed_count} symbols processed, "
-          f"{found_references} references found")
+    # Resolve all reference locations in one query
+    print(f"Resolving {len(line_nums)} reference locations...")
+    reference_count = resolve_references(conn, referenced_ids, file_paths, line_nums)
     
-    return references
+    print(f"\nProcessing complete: {total_symbols} symbols processed, "
+          f"{reference_count} references found")
+    
+    return reference_count
 
 
-def write_csv(references: List[Tuple[int, int, int]], output_file: str) -> None:
-    """Write reference relationships to CSV file"""
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        # Don't write header (as per requirements)
-        # writer.writerow(['referencing_id', 'referenced_id', 'line_num'])
-        
-        for ref in references:
-            writer.writerow(ref)
+def write_csv(conn: duckdb.DuckDBPyConnection, output_file: str) -> None:
+    """Write reference relationships in refs_out to CSV file"""
+    # DuckDB writes the file directly; the line terminator matches csv.writer's default.
+    # Don't write header (as per requirements)
+    output_literal = output_file.replace("'", "''")
+    written = conn.execute(f"""
+        COPY refs_out TO '{output_literal}' (HEADER false, NEW_LINE '\r\n')
+    """).fetchone()[0]
     
-    print(f"Written {len(references)} references to {output_file}")
+    print(f"Written {written} references to {output_file}")
 
 
-def show_statistics(conn: duckdb.DuckDBPyConnection, 
-                   references: List[Tuple[int, int, int]]) -> None:
-    """Display statistics"""
+def show_statistics(conn: duckdb.DuckDBPyConnection) -> None:
+    """Display statistics of the references in refs_out"""
     print("\n" + "=" * 60)
     print("Statistics")
     print("=" * 60)
     
-    if not references:
+    total_references, referencing_count, referenced_count = conn.execute("""
+        SELECT COUNT(*), COUNT(DISTINCT referencing_id), COUNT(DISTINCT referenced_id)
+        FROM refs_out
+    """).fetchone()
+    
+    if not total_references:
         print("No references found")
         return
     
     # Basic statistics
-    print(f"Total references: {len(references)}")
+    print(f"Total references: {total_references}")
     
     # Number of unique referencing and referenced
-    referencing_ids = set(ref[0] for ref in references)
-    referenced_ids = set(ref[1] for ref in references)
-    
-    print(f"Unique referencing symbols: {len(referencing_ids)}")
-    print(f"Unique referenced symbols: {len(referenced_ids)}")
+    print(f"Unique referencing symbols: {referencing_count}")
+    print(f"Unique referenced symbols: {referenced_count}")
     
-    # Top 10 most referenced symbols
-    reference_counts = {}
-    for _, referenced_id, _ in references:
-        reference_counts[referenced_id] = reference_counts.get(referenced_id, 0) + 1
-    
-    top_referenced = sorted(reference_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+    # Top 10 most referenced symbols, ties in order of first appearance
+    top_referenced = conn.execute(f"""
+        SELECT d.symbol_name, d.file_path, d.line_num_start, c.cnt
+        FROM (
+            SELECT referenced_id, COUNT(*) AS cnt, MIN(rowid) AS first_row
+            FROM refs_out
+            GROUP BY referenced_id
+            ORDER BY cnt DESC, first_row
+            LIMIT 10
+        ) c
+        JOIN {TABLE_NAME} d ON d.id = c.referenced_id
+        ORDER BY c.cnt DESC, c.first_row
+    """).fetchall()
     
     if top_referenced:
         print("\nTop 10 most referenced symbols:")
-        for ref_id, count in top_referenced:
-            # Get symbol name
-            result = conn.execute(f"""
-                SELECT symbol_name, file_path, line_num_start
-                FROM {TABLE_NAME}
-                WHERE id = ?
-            """, (ref_id,)).fetchone()
-            
-            if result:
-                symbol_name, file_path, line_start = result
-                # Shorten file path for display
-                if len(file_path) > 40:
-                    short_path = "..." + file_path[-37:]
-                else:
-                    short_path = file_path
-                print(f"  {symbol_name:30s} ({short_path}:{line_start}) - {count} references")
+        for symbol_name, file_path, line_start, count in top_referenced:
+            # Shorten file path for display
+            if len(file_path) > 40:
+                short_path = "..." + file_path[-37:]
+            else:
+                short_path = file_path
+            print(f"  {symbol_name:30s} ({short_path}:{line_start}) - {count} references")
 
 
 def main():
@@ -238,19 +314,21 @@ def main():
     
     try:
         # Check table existence
-        table_exists = conn.execute(f"""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_name = '{TABLE_NAME}'
-        """).fetchone()[0]
+        table_exists = conn.execute("""
+            SELECT 1
+            FROM information_schema.tables
+            WHERE table_name = ?
+            LIMIT 1
+        """, [TABLE_NAME]).fetchone()
         
-        if not table_exists:
+        if table_exists is None:
             print(f"Error: Table '{TABLE_NAME}' not found in database.", file=sys.stderr)
             sys.exit(1)
         
         # Display basic table information
-        total_symbols = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
-        unique_symbols = conn.execute(f"SELECT COUNT(DISTINCT symbol_name) FROM {TABLE_NAME}").fetchone()[0]
+        total_symbols, unique_symbols = conn.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT symbol_name) FROM {TABLE_NAME}"
+        ).fetchone()
         
         print("=" * 60)
         print("Symbol Reference Extraction")
@@ -263,14 +341,14 @@ def main():
         print()
         
         # Process reference relationships
-        references = process_symbol_references(conn)
+        reference_count = process_symbol_references(conn)
         
         # Write to CSV file
-        if references:
-            write_csv(references, OUTPUT_CSV)
+        if reference_count:
+            write_csv(conn, OUTPUT_CSV)
             
             # Display statistics
-            show_statistics(conn, references)
+            show_statistics(conn)
         else:
             print("No references found to write to CSV")
         
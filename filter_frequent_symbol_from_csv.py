@@ -6,125 +6,275 @@ and display the top 40 most frequent values in descending order.
 When --exclude option is used, the filtered CSV data is automatically output.
 """
 
+import io
+import os
 import csv
 import argparse
 from collections import Counter
-from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+from operator import itemgetter, methodcaller
+from typing import List, Optional, Tuple
 
 
-def get_top_values_from_csv(filepath: str, top_n: int = 40) -> List[str]:
+def count_byte_range(filepath: str, start: int, end: int, fast_csv: bool) -> Tuple[Counter, int]:
     """
-    Count the 2nd elements in a CSV file and return a list of top N values
+    Count the 2nd elements of the lines in a byte range of a CSV file
     
     Args:
         filepath: Path to the CSV file
-        top_n: How many top values to retrieve
+        start: Offset of the first line in the range
+        end: Offset just after the last line in the range
+        fast_csv: Split lines on commas instead of parsing CSV
         
     Returns:
-        List of top N values
+        (Counter of 2nd elements, number of lines in the range)
+    """
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+    
+    lines = io.StringIO(text, newline='')
+    if fast_csv:
+        counter = Counter(
+            parts[1].strip() for parts in map(methodcaller('split', ',', 2), lines)
+            if len(parts) > 1
+        )
+        return counter, text.count('\n')
+    
+    csv_reader = csv.reader(lines)
+    counter = Counter(map(str.strip, chain.from_iterable(
+        map(itemgetter(slice(1, 2)), csv_reader))))
+    return counter, csv_reader.line_num
+
+
+def count_in_parallel(filepath: str, jobs: int, fast_csv: bool = False) -> Tuple[Counter, int]:
+    """
+    Count the 2nd elements in a CSV file by splitting it into byte ranges
+    that are counted in worker processes
+    
+    Args:
+        filepath: Path to the CSV file
+        jobs: Number of worker processes
+        fast_csv: Split lines on commas instead of parsing CSV
+        
+    Returns:
+        (Counter of 2nd elements, number of lines in the file)
+    """
+    size = os.path.getsize(filepath)
+    
+    # Ranges end at line boundaries so that each line is counted by one worker
+    # (quoted fields must not contain line breaks)
+    bounds = [0]
+    with open(filepath, 'rb') as file:
+        for i in range(1, jobs):
+            file.seek(max(size * i // jobs, bounds[-1]))
+            file.readline()
+            bounds.append(file.tell())
+    bounds.append(size)
+    
+    counter = Counter()
+    line_count = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for range_counter, range_lines in executor.map(
+                count_byte_range, repeat(filepath), bounds[:-1], bounds[1:], repeat(fast_csv)):
+            counter.update(range_counter)
+            line_count += range_lines
+    
+    return counter, line_count
+
+
+def count_second_column(
+    filepath: str,
+    rows: Optional[List[List[str]]] = None,
+    warn: bool = False,
+    fast_csv: bool = False,
+    jobs: int = 1
+) -> Optional[Counter]:
+    """
+    Count the 2nd elements in a CSV file in a single pass
+    
+    Args:
+        filepath: Path to the CSV file
+        rows: If given, rows having a 2nd element are appended to this list
+        warn: Whether to print a warning for rows without enough elements
+        fast_csv: Split lines on commas instead of parsing CSV when only counting
+                  (no quoted fields; rows without enough elements are skipped silently)
+        jobs: Number of worker processes counting byte ranges of the file when
+              only counting (no line breaks inside quoted fields)
+        
+    Returns:
+        Counter of 2nd elements, or None if the file could not be read
     """
-    second_elements = []
+    counter = Counter()
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as file:
+        if jobs > 1 and rows is None:
+            counter, line_count = count_in_parallel(filepath, jobs, fast_csv)
+            if fast_csv or not warn or counter.total() == line_count:
+                return counter
+            # Rows without enough elements have to be reported in file order,
+            # so count again in a single pass
+            counter = Counter()
+        
+        with open(filepath, 'r', encoding='utf-8', newline='', buffering=1 << 20) as file:
+            if fast_csv and rows is None:
+                # str.split avoids the csv state machine for known-simple files
+                counter.update(
+                    parts[1].strip() for parts in map(methodcaller('split', ',', 2), file)
+                    if len(parts) > 1
+                )
+                return counter
+            
             csv_reader = csv.reader(file)
             
-            for row_num, row in enumerate(csv_reader, 1):
-                # Skip empty rows
-                if not row:
-                    continue
-                    
-                # Ensure there are at least 2 elements
-                if len(row) < 2:
-                    continue
-                
-                second_element = row[1].strip()  # Remove whitespace
-                second_elements.append(second_element)
+            # row[1:2] is empty for rows without a 2nd element, so the counter is
+            # updated from an iterator chain in C without a per-row Python loop
+            all_rows = csv_reader if rows is None else list(csv_reader)
+            counter.update(map(str.strip, chain.from_iterable(
+                map(itemgetter(slice(1, 2)), all_rows))))
+            
+            # If every line gave a value there is nothing to skip or warn about
+            if counter.total() == csv_reader.line_num:
+                if rows is not None:
+                    rows.extend(all_rows)
+                return counter
+            
+            # Otherwise the counts are still complete, but the empty and short rows
+            # have to be dropped from the kept rows or reported
+            if rows is None:
+                if not warn:
+                    return counter
+                # Only counting: read the file again just to report them
+                file.seek(0)
+                all_rows = csv.reader(file)
+            
+            for row_num, row in enumerate(all_rows, 1):
+                # Ensure there are at least 2 elements (empty rows are skipped silently)
+                if len(row) >= 2:
+                    if rows is not None:
+                        rows.append(row)
+                elif row and warn:
+                    print(f"Warning: Row {row_num} does not have enough elements: {row}")
                     
     except FileNotFoundError:
         print(f"Error: File '{filepath}' not found")
-        return []
+        return None
     except Exception as e:
         print(f"Error: An error occurred while reading the file: {e}")
-        return []
+        return None
     
-    # Count occurrences and get top N values
-    counter = Counter(second_elements)
-    top_items = counter.most_common(top_n)
+    return counter
+
+
+def get_top_values_from_csv(
+    filepath: str,
+    top_n: int = 40,
+    fast_csv: bool = False,
+    jobs: int = 1
+) -> List[str]:
+    """
+    Count the 2nd elements in a CSV file and return a list of top N values
     
-    return [value for value, count in top_items]
+    Args:
+        filepath: Path to the CSV file
+        top_n: How many top values to retrieve
+        fast_csv: Split lines on commas instead of parsing CSV
+        jobs: Number of worker processes used for counting
+        
+    Returns:
+        List of top N values
+    """
+    counter = count_second_column(filepath, fast_csv=fast_csv, jobs=jobs)
+    if counter is None:
+        return []
+    
+    # Get top N values
+    return [value for value, count in counter.most_common(top_n)]
 
 
-def filter_csv_excluding_top_values(
+def process_csv(
     input_filepath: str,
     output_filepath: str,
-    exclude_top40: bool = False
-) -> int:
+    exclude_top40: bool = False,
+    top_n: int = 40
+) -> Tuple[int, List[tuple]]:
     """
-    Output a CSV file excluding rows containing top 40 values
+    Read a CSV file once, output it excluding rows containing top 40 values,
+    and count the 2nd elements of the output rows
     
     Args:
         input_filepath: Path to the input CSV file
         output_filepath: Path to the output CSV file
         exclude_top40: Whether to exclude top 40 values
+        top_n: How many top values of the output rows to return
         
     Returns:
-        Number of output rows
+        (Number of output rows, list of (value, frequency) tuples)
     """
-    # Get list of values to exclude
-    exclude_values = []
+    # Read the rows and count the 2nd elements in the same pass
+    rows = []
+    counter = count_second_column(input_filepath, rows, warn=True)
+    if counter is None:
+        return 0, []
+    
+    # Get set of values to exclude (hashed lookups in the per-row filter)
+    exclude_values = frozenset()
     if exclude_top40:
-        exclude_values = get_top_values_from_csv(input_filepath, 40)
+        exclude_values = frozenset(value for value, count in counter.most_common(40))
         if not exclude_values:
-            return 0
+            return 0, []
     
-    filtered_rows = []
-    
-    try:
-        with open(input_filepath, 'r', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            
-            for row_num, row in enumerate(csv_reader, 1):
-                # Skip empty rows
-                if not row:
-                    continue
-                    
-                # Ensure there are at least 2 elements
-                if len(row) < 2:
-                    print(f"Warning: Row {row_num} does not have enough elements: {row}")
-                    continue
-                
-                second_element = row[1].strip()  # Remove whitespace
-                
-                # Add only if not in exclude list
-                if not exclude_top40 or second_element not in exclude_values:
-                    filtered_rows.append(row)
-                    
-    except FileNotFoundError:
-        print(f"Error: File '{input_filepath}' not found")
-        return 0
-    except Exception as e:
-        print(f"Error: An error occurred while reading the file: {e}")
-        return 0
+    # Add only if not in exclude set
+    filtered_rows = [
+        row for row in rows
+        if row[1].strip() not in exclude_values
+    ]
     
     # Output filtered data
     try:
-        with open(output_filepath, 'w', encoding='utf-8', newline='') as file:
+        with open(output_filepath, 'w', encoding='utf-8', newline='', buffering=1 << 20) as file:
             csv_writer = csv.writer(file)
             csv_writer.writerows(filtered_rows)
             
     except Exception as e:
         print(f"Error: An error occurred while writing the file: {e}")
-        return 0
+        return 0, []
+    
+    # The output rows are counted by the same counter minus the excluded values
+    for value in exclude_values:
+        del counter[value]
+    
+    return len(filtered_rows), counter.most_common(top_n)
+
+
+def filter_csv_excluding_top_values(
+    input_filepath: str,
+    output_filepath: str,
+    exclude_top40: bool = False
+) -> int:
+    """
+    Output a CSV file excluding rows containing top 40 values
     
-    return len(filtered_rows)
+    Args:
+        input_filepath: Path to the input CSV file
+        output_filepath: Path to the output CSV file
+        exclude_top40: Whether to exclude top 40 values
+        
+    Returns:
+        Number of output rows
+    """
+    output_rows, _ = process_csv(input_filepath, output_filepath, exclude_top40, top_n=0)
+    return output_rows
 
 
 def analyze_csv_second_column(
     filepath: str, 
     exclude_top40: bool = False,
-    top_n: int = 40
-) -> List[tuple]:
+    top_n: int = 40,
+    fast_csv: bool = False,
+    jobs: int = 1
+) -> Tuple[List[tuple], int]:
     """
     Count the 2nd elements in a CSV file and return them in descending order of frequency
     
@@ -132,54 +282,26 @@ def analyze_csv_second_column(
         filepath: Path to the CSV file
         exclude_top40: Whether to exclude top 40 values
         top_n: How many top values to display
+        fast_csv: Split lines on commas instead of parsing CSV
+        jobs: Number of worker processes used for counting
         
     Returns:
-        List of (value, frequency) tuples
+        (List of (value, frequency) tuples, total number of counted rows)
     """
-    # Get list of values to exclude
-    exclude_values = []
-    if exclude_top40:
-        exclude_values = get_top_values_from_csv(filepath, 40)
-        if not exclude_values:
-            return []
-    
-    # List to store 2nd elements
-    second_elements = []
+    counter = count_second_column(filepath, warn=True, fast_csv=fast_csv, jobs=jobs)
+    if counter is None:
+        return [], 0
     
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            
-            for row_num, row in enumerate(csv_reader, 1):
-                # Skip empty rows
-                if not row:
-                    continue
-                    
-                # Ensure there are at least 2 elements
-                if len(row) < 2:
-                    print(f"Warning: Row {row_num} does not have enough elements: {row}")
-                    continue
-                
-                second_element = row[1].strip()  # Remove whitespace
-                
-                # Add only if not in exclude list
-                if second_element not in exclude_values:
-                    second_elements.append(second_element)
-                    
-    except FileNotFoundError:
-        print(f"Error: File '{filepath}' not found")
-        return []
-    except Exception as e:
-        print(f"Error: An error occurred while reading the file: {e}")
-        return []
-    
-    # Count occurrences
-    counter = Counter(second_elements)
+    # Excluding the rows containing the top 40 values leaves the other counts
+    # unchanged, so drop them from the counter instead of reading the file again
+    if exclude_top40:
+        for value, count in counter.most_common(40):
+            del counter[value]
     
     # Sort by frequency and get top N
     top_items = counter.most_common(top_n)
     
-    return top_items
+    return top_items, counter.total()
 
 
 def main():
@@ -217,8 +339,27 @@ def main():
         help='Display verbose information'
     )
     
+    parser.add_argument(
+        '--fast-csv',
+        action='store_true',
+        help='Count by splitting lines on commas (only for CSV without quoted fields; '
+             'rows without a 2nd element are skipped without warning; not used with --exclude)'
+    )
+    
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='Number of processes used to count the CSV file '
+             '(only for CSV without line breaks in quoted fields; not used with --exclude; default: 1)'
+    )
+    
     args = parser.parse_args()
     
+    if args.exclude and (args.fast_csv or args.jobs != 1):
+        # Filtering has to parse every row to write it, so it is always a single csv.reader pass
+        print("Warning: --fast-csv and --jobs are ignored with --exclude")
+    
     if args.verbose:
         print(f"File: {args.filepath}")
         if args.exclude:
@@ -228,45 +369,41 @@ def main():
         print(f"Display count: {args.top}")
         print("-" * 50)
     
-    # Output filtered CSV file (when --exclude and --output are specified)
-    if args.exclude and args.output:
-        output_rows = filter_csv_excluding_top_values(
+    if args.exclude:
+        # Output filtered CSV file and count it in the same pass over the input
+        if args.output:
+            output_filepath = args.output
+        else:
+            # When --exclude is specified but --output is not
+            # Automatically generate output filename
+            input_name = args.filepath.rsplit('.', 1)[0]  # Remove extension
+            output_filepath = f"{input_name}_filtered.csv"
+        
+        output_rows, results = process_csv(
             args.filepath,
-            args.output,
-            True
+            output_filepath,
+            True,
+            args.top
         )
         
         if output_rows > 0:
-            print(f"Filtered CSV data output to '{args.output}' ({output_rows} rows)")
+            print(f"Filtered CSV data output to '{output_filepath}' ({output_rows} rows)")
             print("-" * 50)
         else:
             print("Failed to output CSV data")
             return
-    elif args.exclude and not args.output:
-        # When --exclude is specified but --output is not
-        # Automatically generate output filename
-        input_name = args.filepath.rsplit('.', 1)[0]  # Remove extension
-        auto_output = f"{input_name}_filtered.csv"
         
-        output_rows = filter_csv_excluding_top_values(
+        # Every output row has a counted 2nd element
+        total_rows = output_rows
+    else:
+        # Execute analysis
+        results, total_rows = analyze_csv_second_column(
             args.filepath,
-            auto_output,
-            True
+            False,
+            args.top,
+            args.fast_csv,
+            args.jobs
         )
-        
-        if output_rows > 0:
-            print(f"Filtered CSV data output to '{auto_output}' ({output_rows} rows)")
-            print("-" * 50)
-        else:
-            print("Failed to output CSV data")
-            return
-    
-    # Execute analysis
-    results = analyze_csv_second_column(
-        args.filepath,
-        args.exclude,
-        args.top
-    )
     
     if not results:
         print("No results obtained")
@@ -285,7 +422,6 @@ def main():
         print(f"{rank:<4} {value:<15} {count:<8}")
     
     if args.verbose:
-        total_rows = sum(count for _, count in results)
         print("-" * 50)
         print(f"Total counted rows: {total_rows}")
 
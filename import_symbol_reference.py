@@ -3,30 +3,35 @@
 Script to import symbol_references_filtered.csv into DuckDB's symbol_reference table
 """
 
+import os
 import sys
 import csv
+import tempfile
 import duckdb
 from pathlib import Path
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 # Database configuration
 DB_FILE = "global_symbols.db"
 TABLE_NAME = "symbol_reference"
+STAGING_TABLE_NAME = "staged_symbol_reference"
 CSV_FILE = "symbol_references_filtered.csv"  # Filename as specified by user
+CHUNK_SIZE = 100000  # Records held in memory at a time while reading the CSV
+INTEGER_PATTERN = r'\s*[+-]?[0-9]+\s*'  # Values int() accepts and DuckDB casts the same way
 
 
 def create_table_if_not_exists(conn: duckdb.DuckDBPyConnection) -> bool:
     """
-    Create symbol_reference table and indexes if they don't exist
+    Create symbol_reference table if it doesn't exist
     Returns: True if table was created, False if it already existed
     """
     
     # Check table existence
-    table_exists = conn.execute(f"""
-        SELECT COUNT(*) 
-        FROM information_schema.tables 
-        WHERE table_name = '{TABLE_NAME}'
-    """).fetchone()[0]
+    table_exists = conn.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.tables
+        WHERE table_name = ?
+    """, [TABLE_NAME]).fetchone()[0]
     
     if table_exists:
         print(f"Table '{TABLE_NAME}' already exists. Skipping creation.")
@@ -43,31 +48,38 @@ def create_table_if_not_exists(conn: duckdb.DuckDBPyConnection) -> bool:
         )
     """)
     
-    # Create indexes
+    print(f"Table '{TABLE_NAME}' created successfully.")
+    return True
+
+
+def create_indexes(conn: duckdb.DuckDBPyConnection) -> None:
+    """
+    Create indexes on symbol_reference if they don't exist
+    Called after the bulk load so that rows are not indexed one by one
+    """
     print("Creating indexes...")
     
     # Index for from_node column
     conn.execute(f"""
-        CREATE INDEX idx_{TABLE_NAME}_from_node ON {TABLE_NAME} (from_node)
+        CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_from_node ON {TABLE_NAME} (from_node)
     """)
     
     # Index for to_node column
     conn.execute(f"""
-        CREATE INDEX idx_{TABLE_NAME}_to_node ON {TABLE_NAME} (to_node)
+        CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_to_node ON {TABLE_NAME} (to_node)
     """)
     
-    print(f"Table '{TABLE_NAME}' and indexes created successfully.")
-    return True
+    print("Indexes created successfully.")
 
 
-def read_csv_file(csv_file: str) -> List[Tuple[int, int, int]]:
+def read_csv_file(csv_file: str) -> Iterator[List[Tuple[int, int, int]]]:
     """
-    Read CSV file and return as a list of integer value tuples
+    Read CSV file and yield integer value tuples in lists of up to CHUNK_SIZE
     """
     records = []
     
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
+        with open(csv_file, 'r', encoding='utf-8', newline='', buffering=1 << 20) as f:
             reader = csv.reader(f)
             
             for row_num, row in enumerate(reader, 1):
@@ -88,6 +100,10 @@ def read_csv_file(csv_file: str) -> List[Tuple[int, int, int]]:
                     
                     records.append((from_id, to_id, line_num))
                     
+                    if len(records) >= CHUNK_SIZE:
+                        yield records
+                        records = []
+                    
                 except ValueError as e:
                     print(f"Warning: Line {row_num} contains non-integer values: {row}. Skipping.")
                     continue
@@ -99,28 +115,88 @@ def read_csv_file(csv_file: str) -> List[Tuple[int, int, int]]:
         print(f"Error reading CSV file: {e}", file=sys.stderr)
         sys.exit(1)
     
-    return records
+    if records:
+        yield records
+
+
+def stage_csv_file(conn: duckdb.DuckDBPyConnection, csv_file: str) -> Optional[int]:
+    """
+    Parse CSV file with DuckDB's CSV reader into the staging table
+    Returns: number of staged records, or None if the file contains lines
+             that have to go through read_csv_file to be reported
+    """
+    # Columns are read as text and must look like int() input, so anything
+    # the Python reader would warn about makes the whole statement fail
+    try:
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE {STAGING_TABLE_NAME} AS
+            SELECT CAST(from_node AS INTEGER) AS from_node,
+                   CAST(to_node AS INTEGER) AS to_node,
+                   CAST(line_num_in_from AS INTEGER) AS line_num_in_from
+            FROM read_csv(?, header = false, auto_detect = false,
+                          delim = ',', quote = '"', escape = '"',
+                          columns = {{'from_node': 'VARCHAR', 'to_node': 'VARCHAR',
+                                      'line_num_in_from': 'VARCHAR'}})
+            WHERE CASE WHEN regexp_full_match(from_node, ?)
+                            AND regexp_full_match(to_node, ?)
+                            AND regexp_full_match(line_num_in_from, ?) THEN true
+                       ELSE error('non-integer value') END
+        """, [csv_file, INTEGER_PATTERN, INTEGER_PATTERN, INTEGER_PATTERN])
+    except duckdb.Error:
+        return None
+    
+    return conn.execute(f'SELECT COUNT(*) FROM {STAGING_TABLE_NAME}').fetchone()[0]
+
+
+def stage_records(conn: duckdb.DuckDBPyConnection,
+                  record_chunks: Iterable[List[Tuple[int, int, int]]]) -> int:
+    """
+    Load validated records into the staging table through a temporary CSV file
+    Returns: number of staged records
+    """
+    record_count = 0
+    fd, csv_path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='', buffering=1 << 20) as f:
+            for records in record_chunks:
+                f.writelines(f"{from_id},{to_id},{line_num}\n" for from_id, to_id, line_num in records)
+                record_count += len(records)
+        
+        # Bulk load the file; executemany binds every row separately
+        # (an empty file cannot be read, and insert_records skips 0 records anyway)
+        if record_count:
+            conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE {STAGING_TABLE_NAME} AS
+                SELECT from_node, to_node, line_num_in_from
+                FROM read_csv(?, header = false,
+                              columns = {{'from_node': 'INTEGER', 'to_node': 'INTEGER',
+                                          'line_num_in_from': 'INTEGER'}})
+            """, [csv_path])
+    finally:
+        os.unlink(csv_path)
+    
+    return record_count
 
 
-def insert_records(conn: duckdb.DuckDBPyConnection, 
-                  records: List[Tuple[int, int, int]]) -> None:
+def insert_records(conn: duckdb.DuckDBPyConnection, record_count: int) -> None:
     """
-    Insert records into table
+    Insert records from the staging table into table
     """
-    if not records:
+    if not record_count:
         print("No records to insert.")
         return
     
-    print(f"Inserting {len(records)} records into {TABLE_NAME}...")
+    print(f"Inserting {record_count} records into {TABLE_NAME}...")
     
-    # Batch insert (efficient)
-    conn.executemany(f"""
+    conn.execute(f"""
         INSERT INTO {TABLE_NAME} (from_node, to_node, line_num_in_from)
-        VALUES (?, ?, ?)
-    """, records)
+        SELECT from_node, to_node, line_num_in_from
+        FROM {STAGING_TABLE_NAME}
+    """)
+    conn.execute(f"DROP TABLE {STAGING_TABLE_NAME}")
     
     conn.commit()
-    print(f"Successfully inserted {len(records)} records.")
+    print(f"Successfully inserted {record_count} records.")
 
 
 def show_statistics(conn: duckdb.DuckDBPyConnection) -> None:
@@ -145,67 +221,55 @@ def show_statistics(conn: duckdb.DuckDBPyConnection) -> None:
         
         # Top 10 most referenced symbols (by to_node column)
         print("\nTop 10 most referenced symbols (by 'to_node' ID):")
-        top_referenced = conn.execute(f"""
-            SELECT to_node, COUNT(*) as ref_count
-            FROM {TABLE_NAME}
-            GROUP BY to_node
-            ORDER BY ref_count DESC
-            LIMIT 10
-        """).fetchall()
-        
-        for to_id, count in top_referenced:
-            # Get name from symbol_definitions table (if exists)
-            try:
-                symbol_info = conn.execute("""
-                    SELECT symbol_name, file_path, line_num_start
-                    FROM symbol_definitions
-                    WHERE id = ?
-                """, (to_id,)).fetchone()
-                
-                if symbol_info:
-                    symbol_name, file_path, line_start = symbol_info
-                    # Shorten file path for display
-                    if len(file_path) > 40:
-                        short_path = "..." + file_path[-37:]
-                    else:
-                        short_path = file_path
-                    print(f"  ID {to_id:6d}: {symbol_name:30s} ({short_path}:{line_start}) - {count} references")
-                else:
-                    print(f"  ID {to_id:6d}: [Symbol not found] - {count} references")
-            except:
-                print(f"  ID {to_id:6d}: - {count} references")
+        print_top_nodes(conn, 'to_node')
         
         # Top 10 symbols with most references (by from_node column)
         print("\nTop 10 symbols with most references (by 'from_node' ID):")
-        top_referencing = conn.execute(f"""
-            SELECT from_node, COUNT(*) as ref_count
+        print_top_nodes(conn, 'from_node')
+
+
+def print_top_nodes(conn: duckdb.DuckDBPyConnection, node_column: str) -> None:
+    """
+    Display the 10 IDs of node_column with the most references,
+    joined with their names in the symbol_definitions table
+    """
+    try:
+        top_nodes = conn.execute(f"""
+            WITH top_nodes AS (
+                SELECT {node_column} AS node_id, COUNT(*) as ref_count
+                FROM {TABLE_NAME}
+                GROUP BY {node_column}
+                ORDER BY ref_count DESC
+                LIMIT 10
+            )
+            SELECT t.node_id, t.ref_count, s.symbol_name, s.file_path, s.line_num_start
+            FROM top_nodes t
+            LEFT JOIN symbol_definitions s ON s.id = t.node_id
+            ORDER BY t.ref_count DESC
+        """).fetchall()
+    except duckdb.CatalogException:
+        # symbol_definitions table does not exist
+        top_nodes = conn.execute(f"""
+            SELECT {node_column}, COUNT(*) as ref_count
             FROM {TABLE_NAME}
-            GROUP BY from_node
+            GROUP BY {node_column}
             ORDER BY ref_count DESC
             LIMIT 10
         """).fetchall()
-        
-        for from_id, count in top_referencing:
-            # Get name from symbol_definitions table (if exists)
-            try:
-                symbol_info = conn.execute("""
-                    SELECT symbol_name, file_path, line_num_start
-                    FROM symbol_definitions
-                    WHERE id = ?
-                """, (from_id,)).fetchone()
-                
-                if symbol_info:
-                    symbol_name, file_path, line_start = symbol_info
-                    # Shorten file path for display
-                    if len(file_path) > 40:
-                        short_path = "..." + file_path[-37:]
-                    else:
-                        short_path = file_path
-                    print(f"  ID {from_id:6d}: {symbol_name:30s} ({short_path}:{line_start}) - {count} references")
-                else:
-                    print(f"  ID {from_id:6d}: [Symbol not found] - {count} references")
-            except:
-                print(f"  ID {from_id:6d}: - {count} references")
+        for node_id, count in top_nodes:
+            print(f"  ID {node_id:6d}: - {count} references")
+        return
+    
+    for node_id, count, symbol_name, file_path, line_start in top_nodes:
+        if symbol_name is not None:
+            # Shorten file path for display
+            if len(file_path) > 40:
+                short_path = "..." + file_path[-37:]
+            else:
+                short_path = file_path
+            print(f"  ID {node_id:6d}: {symbol_name:30s} ({short_path}:{line_start}) - {count} references")
+        else:
+            print(f"  ID {node_id:6d}: [Symbol not found] - {count} references")
 
 
 def main():
@@ -230,7 +294,12 @@ def main():
         sys.exit(1)
     
     # Database connection
-    conn = duckdb.connect(DB_FILE)
+    # The order of the loaded references does not matter, so the bulk
+    # insert may run on all cores without preserving it
+    conn = duckdb.connect(DB_FILE, config={
+        'threads': os.cpu_count() or 1,
+        'preserve_insertion_order': False,
+    })
     
     try:
         # Create table (if needed)
@@ -238,10 +307,13 @@ def main():
         
         # Read CSV file
         print(f"\nReading CSV file '{CSV_FILE}'...")
-        records = read_csv_file(CSV_FILE)
+        record_count = stage_csv_file(conn, CSV_FILE)
+        if record_count is None:
+            # Validate line by line to report the malformed lines
+            record_count = stage_records(conn, read_csv_file(CSV_FILE))
         
-        if records:
-            print(f"Read {len(records)} valid records from CSV.")
+        if record_count:
+            print(f"Read {record_count} valid records from CSV.")
             
             # Check existing record count
             existing_records = conn.execute(f'SELECT COUNT(*) FROM {TABLE_NAME}').fetchone()[0]
@@ -253,12 +325,14 @@ def main():
                     return
             
             # Insert records
-            insert_records(conn, records)
+            insert_records(conn, record_count)
+            create_indexes(conn)
             
             # Display statistics
             show_statistics(conn)
         else:
             print("No valid records found in CSV file.")
+            create_indexes(conn)
         
         print("\n" + "=" * 60)
         print("Import completed successfully!")
@@ -268,7 +342,10 @@ def main():
         print(f"Error: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc()
-        conn.rollback()
+        try:
+            conn.rollback()
+        except duckdb.TransactionException:
+            pass  # The error happened outside a transaction; nothing to roll back
         sys.exit(1)
     finally:
         conn.close()
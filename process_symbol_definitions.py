@@ -3,6 +3,7 @@
 Script to set line_num_end in the symbol_definitions table and remove duplicates
 """
 
+import os
 import sys
 import duckdb
 from pathlib import Path
@@ -21,72 +22,62 @@ def process_line_num_end(conn: duckdb.DuckDBPyConnection) -> None:
     print("Processing line_num_end values...")
     print("=" * 60)
     
-    # Get all records in ID ascending order
-    records = conn.execute(f"""
-        SELECT id, symbol_name, file_path, line_num_start, line_num_end
-        FROM {TABLE_NAME}
-        ORDER BY id
-    """).fetchall()
-    
-    if not records:
+    if conn.execute(f"SELECT 1 FROM {TABLE_NAME} LIMIT 1").fetchone() is None:
         print("No records found in the table.")
         return
     
-    # List of IDs to delete
-    ids_to_delete = []
-    # List of records to update: (id, line_num_end)
-    updates = []
+    # Pair each record with the next one in ID ascending order, keeping only
+    # consecutive records with the same file_path.
+    # Last record or last record of file is left out (line_num_end stays 0)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE line_num_end_pairs AS
+        SELECT id, symbol_name, file_path, line_num_start, next_id, next_line_start,
+               symbol_name = next_symbol AS is_typedef
+        FROM (
+            SELECT id, symbol_name, file_path, line_num_start,
+                   LEAD(id) OVER w AS next_id,
+                   LEAD(symbol_name) OVER w AS next_symbol,
+                   LEAD(file_path) OVER w AS next_file,
+                   LEAD(line_num_start) OVER w AS next_line_start
+            FROM {TABLE_NAME}
+            WINDOW w AS (ORDER BY id)
+        )
+        WHERE file_path = next_file
+    """)
     
-    i = 0
-    while i < len(records) - 1:
-        current = records[i]
-        next_rec = records[i + 1]
-        
-        current_id = current[0]
-        current_symbol = current[1]
-        current_file = current[2]
-        current_line_start = current[3]
-        
-        next_id = next_rec[0]
-        next_symbol = next_rec[1]
-        next_file = next_rec[2]
-        next_line_start = next_rec[3]
-        
-        # Consecutive records with the same file_path
-        if current_file == next_file:
-            # When symbol_name is also the same (handling typedef for structs)
-            if current_symbol == next_symbol:
-                # Set line_num_end of current record to line_num_start of next record
-                updates.append((current_id, next_line_start))
-                # Add next record to deletion list
-                ids_to_delete.append(next_id)
-                print(f"  Merging typedef: {current_symbol} in {current_file} (lines {current_line_start}-{next_line_start})")
-            else:
-                # Normal consecutive records: line_num_end = next_line_start - 1
-                updates.append((current_id, next_line_start - 1))
-        
-        i += 1
+    # When symbol_name is also the same (handling typedef for structs),
+    # the next record is merged into the current one
+    merged = conn.execute("""
+        SELECT symbol_name, file_path, line_num_start, next_line_start
+        FROM line_num_end_pairs
+        WHERE is_typedef
+        ORDER BY id
+    """).fetchall()
+    for symbol, file_path, line_start, next_line_start in merged:
+        print(f"  Merging typedef: {symbol} in {file_path} (lines {line_start}-{next_line_start})")
     
-    # Leave line_num_end as 0 for last record or last record of file (or set appropriate value)
-    # No processing here (leave as 0)
+    update_count = conn.execute("SELECT COUNT(*) FROM line_num_end_pairs").fetchone()[0]
     
     # Execute updates
-    print(f"\nApplying {len(updates)} updates...")
-    for id_val, line_end in updates:
-        conn.execute(f"""
-            UPDATE {TABLE_NAME}
-            SET line_num_end = ?
-            WHERE id = ?
-        """, (line_end, id_val))
+    # typedef: line_num_end = next_line_start, otherwise next_line_start - 1
+    print(f"\nApplying {update_count} updates...")
+    conn.execute(f"""
+        UPDATE {TABLE_NAME}
+        SET line_num_end = CASE WHEN p.is_typedef THEN p.next_line_start ELSE p.next_line_start - 1 END
+        FROM line_num_end_pairs p
+        WHERE {TABLE_NAME}.id = p.id
+    """)
     
     # Execute deletions
-    if ids_to_delete:
-        print(f"Deleting {len(ids_to_delete)} merged records...")
-        for id_val in ids_to_delete:
-            conn.execute(f"DELETE FROM {TABLE_NAME} WHERE id = ?", (id_val,))
+    if merged:
+        print(f"Deleting {len(merged)} merged records...")
+        conn.execute(f"""
+            DELETE FROM {TABLE_NAME}
+            WHERE id IN (SELECT next_id FROM line_num_end_pairs WHERE is_typedef)
+        """)
     
-    conn.commit()
-    print(f"Processing complete: {len(updates)} records updated, {len(ids_to_delete)} records deleted")
+    conn.execute("DROP TABLE line_num_end_pairs")
+    print(f"Processing complete: {update_count} records updated, {len(merged)} records deleted")
 
 
 def process_symbol_duplicates(conn: duckdb.DuckDBPyConnection) -> None:
@@ -97,91 +88,93 @@ def process_symbol_duplicates(conn: duckdb.DuckDBPyConnection) -> None:
     print("Processing symbol name duplicates...")
     print("=" * 60)
     
-    # Get all records sorted by symbol_name
-    records = conn.execute(f"""
-        SELECT id, symbol_name, file_path, line_num_start, line_num_end, line_content
-        FROM {TABLE_NAME}
-        ORDER BY symbol_name, file_path, line_num_start
-    """).fetchall()
-    
-    if not records:
+    if conn.execute(f"SELECT 1 FROM {TABLE_NAME} LIMIT 1").fetchone() is None:
         print("No records found in the table.")
         return
     
-    # List of IDs to delete
-    ids_to_delete = []
-    # List of unhandled duplicates
-    unhandled_duplicates = []
+    # Pair each record with the next one sorted by symbol_name, keeping only
+    # consecutive records with the same symbol_name.
+    # ext follows Path.suffix (a leading dot of the file name is not a suffix)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE symbol_duplicate_pairs AS
+        SELECT *,
+               CASE
+                   -- Combination of h file and c file: delete h file record
+                   WHEN ext = '.h' AND next_ext = '.c' THEN id
+                   WHEN ext = '.c' AND next_ext = '.h' THEN next_id
+                   -- Both are c files and same file: delete the one with smaller
+                   -- line_num_start (consider as prototype declaration)
+                   WHEN ext = '.c' AND next_ext = '.c' AND file_path = next_file THEN
+                       CASE WHEN line_num_start < next_line_start THEN id ELSE next_id END
+               END AS delete_id
+        FROM (
+            SELECT ROW_NUMBER() OVER w AS seq,
+                   id, symbol_name, file_path, line_num_start, line_content, ext,
+                   LEAD(id) OVER w AS next_id,
+                   LEAD(symbol_name) OVER w AS next_symbol,
+                   LEAD(file_path) OVER w AS next_file,
+                   LEAD(line_num_start) OVER w AS next_line_start,
+                   LEAD(line_content) OVER w AS next_line_content,
+                   LEAD(ext) OVER w AS next_ext
+            FROM (
+                SELECT id, symbol_name, file_path, line_num_start, line_content,
+                       regexp_extract(file_path, '[^/](\\.[^./]+)$', 1) AS ext
+                FROM {TABLE_NAME}
+            )
+            WINDOW w AS (ORDER BY symbol_name, file_path, line_num_start)
+        )
+        WHERE symbol_name = next_symbol
+    """)
     
-    i = 0
-    while i < len(records) - 1:
-        current = records[i]
-        next_rec = records[i + 1]
-        
-        current_id = current[0]
-        current_symbol = current[1]
-        current_file = current[2]
-        current_line_start = current[3]
-        current_line_content = current[5]
-        
-        next_id = next_rec[0]
-        next_symbol = next_rec[1]
-        next_file = next_rec[2]
-        next_line_start = next_rec[3]
-        next_line_content = next_rec[5]
-        
-        # Consecutive records with the same symbol_name
-        if current_symbol == next_symbol:
-            # Get file extensions
-            current_ext = Path(current_file).suffix
-            next_ext = Path(next_file).suffix
-            
-            # Combination of h file and c file
-            if {current_ext, next_ext} == {'.h', '.c'}:
-                # Delete h file record
-                if current_ext == '.h':
-                    ids_to_delete.append(current_id)
-                    print(f"  Removing extern declaration: {current_symbol} from {current_file}")
-                else:
-                    ids_to_delete.append(next_id)
-                    print(f"  Removing extern declaration: {next_symbol} from {next_file}")
-            
-            # Both are c files and same file
-            elif current_ext == '.c' and next_ext == '.c' and current_file == next_file:
-                # Delete the one with smaller line_num_start (consider as prototype declaration)
-                if current_line_start < next_line_start:
-                    ids_to_delete.append(current_id)
-                    print(f"  Removing prototype: {current_symbol} at line {current_line_start} in {current_file}")
-                else:
-                    ids_to_delete.append(next_id)
-                    print(f"  Removing prototype: {next_symbol} at line {next_line_start} in {next_file}")
-            
-            # Cases that don't match any of the above
-            else:
-                unhandled_duplicates.append((current, next_rec))
-        
-        i += 1
+    # Records removed by the rules above, in pair order
+    removed = conn.execute("""
+        SELECT symbol_name,
+               CASE WHEN delete_id = id THEN file_path ELSE next_file END,
+               CASE WHEN delete_id = id THEN line_num_start ELSE next_line_start END,
+               CASE WHEN delete_id = id THEN ext ELSE next_ext END
+        FROM symbol_duplicate_pairs
+        WHERE delete_id IS NOT NULL
+        ORDER BY seq
+    """).fetchall()
+    for symbol, file_path, line_start, ext in removed:
+        if ext == '.h':
+            print(f"  Removing extern declaration: {symbol} from {file_path}")
+        else:
+            print(f"  Removing prototype: {symbol} at line {line_start} in {file_path}")
+    delete_count = len(removed)
+    
+    # Cases that don't match any of the above
+    unhandled_duplicates = conn.execute("""
+        SELECT id, symbol_name, file_path, line_num_start, line_content,
+               next_id, next_file, next_line_start, next_line_content
+        FROM symbol_duplicate_pairs
+        WHERE delete_id IS NULL
+        ORDER BY seq
+    """).fetchall()
     
     # Output unhandled duplicates to stderr
     if unhandled_duplicates:
         print("\n" + "=" * 60, file=sys.stderr)
         print("WARNING: Unhandled duplicate symbols:", file=sys.stderr)
         print("=" * 60, file=sys.stderr)
-        for current, next_rec in unhandled_duplicates:
-            print(f"\nDuplicate symbol: {current[1]}", file=sys.stderr)
-            print(f"  Record 1: ID={current[0]}, File={current[2]}, Line={current[3]}", file=sys.stderr)
-            print(f"    Content: {current[5][:80]}...", file=sys.stderr)
-            print(f"  Record 2: ID={next_rec[0]}, File={next_rec[2]}, Line={next_rec[3]}", file=sys.stderr)
-            print(f"    Content: {next_rec[5][:80]}...", file=sys.stderr)
+        for (current_id, symbol, current_file, current_line_start, current_line_content,
+             next_id, next_file, next_line_start, next_line_content) in unhandled_duplicates:
+            print(f"\nDuplicate symbol: {symbol}", file=sys.stderr)
+            print(f"  Record 1: ID={current_id}, File={current_file}, Line={current_line_start}", file=sys.stderr)
+            print(f"    Content: {current_line_content[:80]}...", file=sys.stderr)
+            print(f"  Record 2: ID={next_id}, File={next_file}, Line={next_line_start}", file=sys.stderr)
+            print(f"    Content: {next_line_content[:80]}...", file=sys.stderr)
     
     # Execute deletions
-    if ids_to_delete:
-        print(f"\nDeleting {len(ids_to_delete)} duplicate records...")
-        for id_val in ids_to_delete:
-            conn.execute(f"DELETE FROM {TABLE_NAME} WHERE id = ?", (id_val,))
+    if delete_count:
+        print(f"\nDeleting {delete_count} duplicate records...")
+        conn.execute(f"""
+            DELETE FROM {TABLE_NAME}
+            WHERE id IN (SELECT delete_id FROM symbol_duplicate_pairs)
+        """)
     
-    conn.commit()
-    print(f"Processing complete: {len(ids_to_delete)} records deleted, {len(unhandled_duplicates)} unhandled duplicates")
+    conn.execute("DROP TABLE symbol_duplicate_pairs")
+    print(f"Processing complete: {delete_count} records deleted, {len(unhandled_duplicates)} unhandled duplicates")
 
 
 def show_statistics(conn: duckdb.DuckDBPyConnection) -> None:
@@ -192,39 +185,35 @@ def show_statistics(conn: duckdb.DuckDBPyConnection) -> None:
     print("Database Statistics")
     print("=" * 60)
     
-    # Total record count
-    total_records = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
-    print(f"Total records: {total_records}")
+    # Counts and statistics by file extension in a single scan
+    (total_records, unique_symbols, unique_files, records_with_end,
+     h_records, c_records) = conn.execute(f"""
+        SELECT
+            COUNT(*),
+            COUNT(DISTINCT symbol_name),
+            COUNT(DISTINCT file_path),
+            COUNT(*) FILTER (WHERE line_num_end > 0),
+            COUNT(*) FILTER (WHERE file_path LIKE '%.h'),
+            COUNT(*) FILTER (WHERE file_path LIKE '%.c')
+        FROM {TABLE_NAME}
+    """).fetchone()
     
-    # Unique symbol count
-    unique_symbols = conn.execute(f"SELECT COUNT(DISTINCT symbol_name) FROM {TABLE_NAME}").fetchone()[0]
+    print(f"Total records: {total_records}")
     print(f"Unique symbols: {unique_symbols}")
-    
-    # Unique file count
-    unique_files = conn.execute(f"SELECT COUNT(DISTINCT file_path) FROM {TABLE_NAME}").fetchone()[0]
     print(f"Unique files: {unique_files}")
-    
-    # Record count with line_num_end set
-    records_with_end = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE line_num_end > 0").fetchone()[0]
     print(f"Records with line_num_end set: {records_with_end}")
     
-    # Statistics by file extension
     print("\nRecords by file extension:")
-    ext_stats = conn.execute(f"""
-        SELECT 
-            CASE 
-                WHEN file_path LIKE '%.h' THEN '.h'
-                WHEN file_path LIKE '%.c' THEN '.c'
-                ELSE 'other'
-            END as ext,
-            COUNT(*) as count
-        FROM {TABLE_NAME}
-        GROUP BY ext
-        ORDER BY count DESC
-    """).fetchall()
+    ext_stats = [
+        ('.h', h_records),
+        ('.c', c_records),
+        ('other', total_records - h_records - c_records),
+    ]
+    ext_stats.sort(key=lambda item: item[1], reverse=True)
     
     for ext, count in ext_stats:
-        print(f"  {ext}: {count}")
+        if count > 0:
+            print(f"  {ext}: {count}")
     
     # Duplicate symbol statistics
     print("\nSymbols with multiple definitions:")
@@ -253,15 +242,20 @@ def main():
         sys.exit(1)
     
     # Database connection
-    conn = duckdb.connect(DB_FILE)
+    # Every order-dependent step sorts explicitly (ORDER BY / window ORDER BY),
+    # so scans and sorts may run on all cores without keeping insertion order
+    conn = duckdb.connect(DB_FILE, config={
+        'threads': os.cpu_count() or 1,
+        'preserve_insertion_order': False,
+    })
     
     try:
         # Check table existence
-        table_exists = conn.execute(f"""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_name = '{TABLE_NAME}'
-        """).fetchone()[0]
+        table_exists = conn.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.tables
+            WHERE table_name = ?
+        """, [TABLE_NAME]).fetchone()[0]
         
         if not table_exists:
             print(f"Error: Table '{TABLE_NAME}' not found in database.", file=sys.stderr)
@@ -271,12 +265,18 @@ def main():
         print("Initial database state:")
         show_statistics(conn)
         
+        # Both processing steps run in one transaction, committed only when
+        # both succeed (rolled back below on error)
+        conn.begin()
+        
         # Processing 1: Set line_num_end
         process_line_num_end(conn)
         
         # Processing 2: Remove symbol_name duplicates
         process_symbol_duplicates(conn)
         
+        conn.commit()
+        
         # Statistics after processing
         print("\nFinal database state:")
         show_statistics(conn)
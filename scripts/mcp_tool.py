@@ -18,6 +18,11 @@ except FileNotFoundError as e:
     print(json.dumps({"error": f"FATAL: Database file not found: {e}"}))
     sys.exit(1)
 
+# The tools only read the database, and agents of concurrently processed batches
+# run several of these processes at once: DuckDB lets any number of processes
+# open a file read-only, but only one open it read-write
+DatabaseConnection.read_only = True
+
  # Directory for temporarily saving documents generated by the AI agent
 TEMP_OUTPUT_DIR = Path("output/temp")
 
@@ -90,9 +95,16 @@ def search_symbols_wrapper(pattern: str) -> dict:
 def return_document(symbol_name: str, content: str) -> dict:
     """Save a document as a temporary file"""
     try:
-        TEMP_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
         file_path = TEMP_OUTPUT_DIR / f"{symbol_name}.md"
-        file_path.write_text(content, encoding='utf-8')
+        data = content.encode('utf-8')
+        try:
+            f = open(file_path, 'wb', buffering=1 << 20)
+        except FileNotFoundError:
+            # Create the directory only when it is missing (first save)
+            TEMP_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+            f = open(file_path, 'wb', buffering=1 << 20)
+        with f:
+            f.write(data)
         
         return {
             "status": "success",
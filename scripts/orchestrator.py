@@ -4,16 +4,63 @@ Main processing for documentation generation using Claude Code.
 DuckDB version - Documents are also stored in the DB (ID-based processing).
 """
 import json
+import heapq
+import re
+import sys
 import duckdb
 import subprocess
 import time
+import argparse
+from collections import deque
+from itertools import repeat
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Optional, Set, Tuple
 
+# Sections of the "## Dependencies" part of a generated document, and the symbol items listed in them
+CALLS_SECTION_RE = re.compile(r'-\s*Functions called/Symbols referenced:\s*\n(.*?)(?=\n-|\n##|\Z)', re.DOTALL)
+CALLED_FROM_SECTION_RE = re.compile(r'-\s*Called from \(representative examples\):\s*\n(.*?)(?=\n-|\n##|\Z)', re.DOTALL)
+SYMBOL_ITEM_RE = re.compile(r'-\s*(\w+)')
+
+# Minimum seconds between two Claude Code CLI launches (rate limiting countermeasure)
+CLI_LAUNCH_INTERVAL = 45
+
+# Number of threads reading generated documents of a batch
+DOCUMENT_READ_WORKERS = 8
+
+def to_json(values: List) -> str:
+    """
+    Serialize a list for a JSON column compactly (no spaces, non-ASCII kept as is)
+    """
+    if not values:
+        return '[]'
+    return json.dumps(values, separators=(',', ':'), ensure_ascii=False)
+
+class LaunchRateLimiter:
+    """
+    Keep at least `min_interval` seconds between launches, waiting only when the previous one was more recent
+    """
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.last_call_time: Optional[float] = None
+
+    def acquire(self):
+        now = time.monotonic()
+        if self.last_call_time is not None:
+            wait = self.last_call_time + self.min_interval - now
+            if wait > 0:
+                time.sleep(wait)
+                now += wait
+        self.last_call_time = now
+
 class DocumentationOrchestrator:
-    def __init__(self, global_symbols_db: str = 'global_symbols.db'):
+    def __init__(self, global_symbols_db: str = 'global_symbols.db', jobs: int = 1):
         self.retry_attempts = 0        
+        # Claude Code CLI runs of up to `jobs` batches of the same layer are in flight at once
+        self.jobs = max(1, jobs)
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self.limiter = LaunchRateLimiter(CLI_LAUNCH_INTERVAL)
         # Load processing batches (ID-based)        
         with open('data/processing_batches.json') as f:
             self.batches = json.load(f)
@@ -23,6 +70,9 @@ class DocumentationOrchestrator:
         
         # Initialize DuckDB
         self.init_databases()
+
+        # Summaries of processed symbols (name -> summary), kept up to date as documents are stored
+        self._summary_cache: Dict[str, str] = self._load_processed_summaries()
         
         # Processing statistics
         self.stats = {
@@ -39,15 +89,30 @@ class DocumentationOrchestrator:
         """
         print(f"Loading symbol details from {db_file}...")
         con = duckdb.connect(db_file, read_only=True)
-        self.symbol_details: Dict[int, Dict] = {
-            row[0]: {
-                'id': row[0],
-                'name': row[1],
-                'type': row[7] if row[7] else 'unknown',
-            } for row in con.execute("SELECT * FROM symbol_definitions").fetchall()
-        }
+        # Read only the columns used here (not the source code in contents)
+        rows = con.execute("""
+            SELECT id, symbol_name, COALESCE(NULLIF(symbol_type, ''), 'unknown') FROM symbol_definitions
+        """).fetchall()
         con.close()
-        print(f"Loaded {len(self.symbol_details)} symbol details into memory.")
+
+        # Kept as parallel lists indexed through _id_to_idx rather than one dict per symbol
+        self._id_to_idx: Dict[int, int] = {row[0]: i for i, row in enumerate(rows)}
+        # Interned so that repeated names and the few distinct types share one string object each
+        self._names: List[str] = [sys.intern(row[1]) for row in rows]
+        self._types: List[str] = [sys.intern(row[2]) for row in rows]
+        print(f"Loaded {len(self._names)} symbol details into memory.")
+
+    def _name(self, symbol_id: int) -> str:
+        """
+        Get the name of a symbol by its ID
+        """
+        return self._names[self._id_to_idx[symbol_id]]
+
+    def _type(self, symbol_id: int) -> str:
+        """
+        Get the type of a symbol by its ID
+        """
+        return self._types[self._id_to_idx[symbol_id]]
 
     def init_databases(self):
         """
@@ -98,17 +163,29 @@ class DocumentationOrchestrator:
         
     def process_all_batches(self):
         """
-        Process all batches sequentially
+        Process all batches in order, running up to `jobs` batches of the same layer concurrently
         """
         processed_ids = self.get_processed_symbol_ids()
+        # Batches whose CLI run has been started: (batch, symbol IDs, future of the run)
+        pending = deque()
         
         for batch in self.batches:
+            # Symbols refer to summaries from earlier layers, so a new layer waits for the previous one
+            while pending and (len(pending) >= self.jobs or pending[0][0]['layer'] != batch['layer']):
+                self.complete_batch(*pending.popleft(), processed_ids)
+
             batch_id = batch['batch_id']
             # Skip check (ID-based)
             unprocessed_ids = [sid for sid in batch['symbol_ids'] if sid not in processed_ids]
             if not unprocessed_ids:
                 print(f"Batch {batch_id}: All symbols already processed, skipping")
                 continue
+
+            # Documents are written to output/temp/<symbol name>.md, so batches sharing
+            # a symbol name (defined in several places) must not run at the same time
+            batch_names = {self._name(sid) for sid in unprocessed_ids}
+            while pending and any(self._name(sid) in batch_names for _, ids, _ in pending for sid in ids):
+                self.complete_batch(*pending.popleft(), processed_ids)
                 
             print(f"\n{'='*60}")
             print(f"Processing batch {batch_id}/{len(self.batches)}")
@@ -116,68 +193,102 @@ class DocumentationOrchestrator:
             print(f"Type: {batch['type']}, Estimated tokens: {batch['estimated_tokens']}")
             print(f"{'='*60}")
             
-            # Process batch
-            success = self.process_batch(batch, unprocessed_ids)
-            
-            if success:
-                self.stats['processed_batches'] += 1
-                self.stats['processed_symbols'] += len(unprocessed_ids)
-                processed_ids.update(unprocessed_ids)
-            else:
-                self.stats['failed_batches'] += 1
-                
-            # Show progress
-            self.show_progress()
+            pending.append((batch, unprocessed_ids, self.start_batch(batch, unprocessed_ids)))
+
+        while pending:
+            self.complete_batch(*pending.popleft(), processed_ids)
+
+    def complete_batch(self, batch: Dict, symbol_ids: List[int], run: Future, processed_ids: Set[int]):
+        """
+        Wait for a started batch, store its results and update statistics
+        """
+        # Process batch
+        success = self.finish_batch(batch, symbol_ids, run)
+        
+        if success:
+            self.stats['processed_batches'] += 1
+            self.stats['processed_symbols'] += len(symbol_ids)
+            processed_ids.update(symbol_ids)
+        else:
+            self.stats['failed_batches'] += 1
             
-            # Rate limiting countermeasure
-            time.sleep(45)
+        # Show progress
+        self.show_progress()
             
     def process_batch(self, batch: Dict, symbol_ids: List[int]) -> bool:
         """
         Process a single batch
         """
+        return self.finish_batch(batch, symbol_ids, self.start_batch(batch, symbol_ids))
+
+    def start_batch(self, batch: Dict, symbol_ids: List[int]) -> Future:
+        """
+        Log the start of a batch and run Claude Code CLI for it in the background
+        """
         batch_id = batch['batch_id']
+
+        # Rate limiting countermeasure (waits only if the previous launch was less than the interval ago)
+        self.limiter.acquire()
         
         # Start log recording
         self.doc_db.execute("""
             INSERT OR REPLACE INTO processing_log 
             (batch_id, symbol_ids, status, started_at, processed_count)
             VALUES (?, ?, 'processing', ?, 0)
-        """, (batch_id, json.dumps(symbol_ids), datetime.now()))
-        self.doc_db.commit()
+        """, (batch_id, to_json(symbol_ids), datetime.now()))
 
         # Build prompt
         prompt, symbols = self.build_prompt(symbol_ids, batch['layer'])
         
+        # Run Claude Code
+        print("Invoking Claude Code CLI...")
+        return self._executor.submit(self.run_claude, prompt, symbols)
+
+    def run_claude(self, prompt: str, symbols: List[str]) -> subprocess.CompletedProcess:
+        """
+        Run Claude Code CLI with the prompt (called in a worker thread, so no DB access here)
+        """
+        return subprocess.run(
+            [
+                'claude', '--allowedTools', 'Bash(python3*),Read', '-p', f"{prompt}",
+                '--model', 'claude-sonnet-4-20250514',
+                '--max-turns', str(min(len(symbols) * 20, 80)),
+                '--permission-mode', 'bypassPermissions',
+            ],
+            capture_output=True,
+            text=True,
+            timeout=3600,
+            cwd=str(Path.cwd())
+        )
+
+    def finish_batch(self, batch: Dict, symbol_ids: List[int], run: Future) -> bool:
+        """
+        Wait for Claude Code CLI run of a batch and record its result
+        """
+        batch_id = batch['batch_id']
+        
         try:
-            # Run Claude Code
-            print("Invoking Claude Code CLI...")
-            result = subprocess.run(
-                [
-                    'claude', '--allowedTools', 'Bash(python3*),Read', '-p', f"{prompt}",
-                    '--model', 'claude-sonnet-4-20250514',
-                    '--max-turns', str(min(len(symbols) * 20, 80)),
-                    '--permission-mode', 'bypassPermissions',
-                ],
-                capture_output=True,
-                text=True,
-                timeout=3600,
-                cwd=str(Path.cwd())
-            )
+            result = run.result()
             
             if result.returncode == 0:
                 print(f"✓ Successfully processed batch {batch_id}")
-                
-                # Log success
-                self.doc_db.execute("""
-                    UPDATE processing_log SET status = 'completed', completed_at = ?, processed_count = ?
-                    WHERE batch_id = ?
-                """, (datetime.now(), len(symbol_ids), batch_id))
 
                 time.sleep(1)
 
-                # Here, instead of parsing directly, assume the agent outputs to a file
-                self.store_generated_documents(symbol_ids, batch['layer'])
+                # Log success and store the documents in one transaction
+                # (committed by store_generated_documents)
+                self.doc_db.begin()
+                try:
+                    self.doc_db.execute("""
+                        UPDATE processing_log SET status = 'completed', completed_at = ?, processed_count = ?
+                        WHERE batch_id = ?
+                    """, (datetime.now(), len(symbol_ids), batch_id))
+
+                    # Here, instead of parsing directly, assume the agent outputs to a file
+                    self.store_generated_documents(symbol_ids, batch['layer'])
+                except Exception:
+                    self.doc_db.rollback()
+                    raise
                 
                 return True
             else:
@@ -228,39 +339,45 @@ class DocumentationOrchestrator:
         finally:
             self.doc_db.commit()
 
-    def get_processed_summaries(self) -> Dict[str, str]:
+    def _load_processed_summaries(self) -> Dict[str, str]:
         """
-        Get summaries of processed symbols (name -> summary)
+        Read summaries of processed symbols (name -> summary) from the documents table
         """
         result = self.doc_db.execute("""
-            SELECT symbol_name, summary FROM documents WHERE summary IS NOT NULL AND summary != ''
-            LIMIT 2000;
+            SELECT symbol_name, summary FROM documents WHERE summary <> '';
         """).fetchall()
         return {row[0]: row[1] for row in result}
 
+    def get_processed_summaries(self) -> Dict[str, str]:
+        """
+        Get summaries of processed symbols (name -> summary)
+        """
+        return self._summary_cache
+
     def build_prompt(self, symbol_ids: List[int], layer: int) -> Tuple[str, List[str]]:
         """
         Build prompt for batch processing
         """
-        symbol_names = [self.symbol_details[sid]['name'] for sid in symbol_ids]
+        symbol_names = [self._name(sid) for sid in symbol_ids]
         symbol_list_str = '\n'.join([f'- {name}' for name in symbol_names])
 
         processed_summaries = self.get_processed_summaries()
         
         relevant_processed = set()
-        for symbol_id in symbol_ids:
-            # Get dependencies for this symbol (ID-based)
-            deps = self.meta_db.execute("""
-                SELECT to_node FROM dependencies WHERE from_node = ?;
-            """, (symbol_id,)).fetchall()
-            
-            for (dep_id,) in deps:
-                dep_name = self.symbol_details.get(dep_id, {}).get('name')
-                if dep_name and dep_name in processed_summaries:
-                    summary = processed_summaries[dep_name]
-                    relevant_processed.add(f"- {dep_name}: {summary[:120]}")
+        # Get dependencies of all symbols in the batch at once (ID-based)
+        placeholders = ', '.join(['?'] * len(symbol_ids))
+        deps = self.meta_db.execute(f"""
+            SELECT DISTINCT to_node FROM dependencies WHERE from_node IN ({placeholders});
+        """, symbol_ids).fetchall()
+
+        for (dep_id,) in deps:
+            dep_idx = self._id_to_idx.get(dep_id)
+            dep_name = self._names[dep_idx] if dep_idx is not None else None
+            if dep_name and dep_name in processed_summaries:
+                summary = processed_summaries[dep_name]
+                relevant_processed.add(f"- {dep_name}: {summary[:120]}")
                     
-        relevant_list_str = '\n'.join(sorted(list(relevant_processed))[:15])
+        relevant_list_str = '\n'.join(heapq.nsmallest(15, relevant_processed))
         
         # Prompt template
         # Prompt assumes referencing index with claude command
@@ -349,63 +466,90 @@ Example: void InitPostgres(const char *in_dbname, Oid dboid, const char *usernam
         temp_dir = Path('output/temp')
         temp_dir.mkdir(exist_ok=True)
         
+        # Temporary file of each symbol (a file is consumed only once, even if symbols share a name)
+        doc_paths: Dict[Path, int] = {}
         for sid in symbol_ids:
-            symbol_name = self.symbol_details[sid]['name']
-            symbol_type = self.symbol_details[sid]['type']
+            symbol_name = self._name(sid)
             doc_path = temp_dir / f"{symbol_name}.md"
             
-            if doc_path.exists():
-                content = doc_path.read_text(encoding='utf-8')
-                summary = self.extract_summary(content)
-                try:
-                    deps, related = self.extract_relationships(content)
-                except Exception as e:
-                    print(f"  Error extracting relationships for {symbol_name}: {e}")
-                    deps, related = [], []
+            if doc_path not in doc_paths and doc_path.exists():
+                doc_paths[doc_path] = sid
+            else:
+                print(f"  Warning: Document file not found for {symbol_name}")
 
-                # Store document in DB (ID-based)
-                self.doc_db.execute("""
-                    INSERT INTO documents (symbol_id, symbol_name, symbol_type, layer, content, summary, dependencies, related_symbols)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT (symbol_id) DO UPDATE SET
-                        content = EXCLUDED.content, summary = EXCLUDED.summary,
-                        dependencies = EXCLUDED.dependencies, related_symbols = EXCLUDED.related_symbols;
-                """, (sid, symbol_name, symbol_type, layer, content, summary, json.dumps(deps), json.dumps(related)))
-                
+        # Read and parse the files in parallel, keeping the batch order
+        staged: Dict[Path, Tuple] = {}
+        if doc_paths:
+            with ThreadPoolExecutor(max_workers=min(DOCUMENT_READ_WORKERS, len(doc_paths))) as executor:
+                rows = executor.map(self._read_document, doc_paths.values(), doc_paths.keys(), repeat(layer))
+                staged = dict(zip(doc_paths.keys(), rows))
+
+        if staged:
+            # Store all documents of the batch in DB with a single statement (ID-based)
+            rows = list(staged.values())
+            placeholders = ', '.join(['(?, ?, ?, ?, ?, ?, ?, ?)'] * len(rows))
+            self.doc_db.execute(f"""
+                INSERT INTO documents (symbol_id, symbol_name, symbol_type, layer, content, summary, dependencies, related_symbols)
+                VALUES {placeholders}
+                ON CONFLICT (symbol_id) DO UPDATE SET
+                    content = EXCLUDED.content, summary = EXCLUDED.summary,
+                    dependencies = EXCLUDED.dependencies, related_symbols = EXCLUDED.related_symbols;
+            """, [value for row in rows for value in row])
+
+            for doc_path, (sid, symbol_name, _, _, _, summary, _, _) in staged.items():
+                if summary:
+                    self._summary_cache[symbol_name] = summary
                 doc_path.unlink() # Delete temporary file
                 print(f"  Stored document for: {symbol_name} (ID: {sid})")
-            else:
-                print(f"  Warning: Document file not found for {symbol_name}")
                 
         self.doc_db.commit()
 
+    def _read_document(self, sid: int, doc_path: Path, layer: int) -> Tuple:
+        """
+        Read a generated document and build its row for the documents table
+        """
+        symbol_name = self._name(sid)
+        content = doc_path.read_text(encoding='utf-8')
+        summary = self.extract_summary(content)
+        try:
+            deps, related = self.extract_relationships(content)
+        except Exception as e:
+            print(f"  Error extracting relationships for {symbol_name}: {e}")
+            deps, related = [], []
+
+        return (sid, symbol_name, self._type(sid), layer, content, summary, to_json(deps), to_json(related))
+
     def extract_summary(self, content: str) -> str:
         """
         Extract summary from document
         """
-        lines = content.split('\n')
-        in_summary = False
+        start = content.find('## Overview')
+        if start < 0:
+            return ''
+        # Walk the lines following the heading without splitting the whole document
         summary_lines = []
-        for line in lines:
+        pos = content.find('\n', start) + 1
+        while pos and len(summary_lines) < 2:
+            end = content.find('\n', pos)
+            line = content[pos:end] if end >= 0 else content[pos:]
+            pos = end + 1
             if '## Overview' in line:
-                in_summary = True
                 continue
-            if in_summary and line.startswith('##'):
+            if line.startswith('##'):
                 break
-            if in_summary and line.strip():
+            if line.strip():
                 summary_lines.append(line.strip())
-        return ' '.join(summary_lines[:2])
+        return ' '.join(summary_lines)
 
     def extract_relationships(self, content: str) -> tuple:
         """
         Extract relationships from document
         """
-        import re
-        deps = re.findall(r'-\s*Functions called/Symbols referenced:\s*\n(.*?)(?=\n-|\n##|\Z)', content, re.DOTALL)
-        deps_list = re.findall(r'-\s*(\w+)', ''.join(deps))
+        deps = CALLS_SECTION_RE.findall(content)
+        deps_list = SYMBOL_ITEM_RE.findall(''.join(deps))
 
-        related = re.findall(r'-\s*Called from \(representative examples\):\s*\n(.*?)(?=\n-|\n##|\Z)', content, re.DOTALL)
-        related_list = re.findall(r'-\s*(\w+)', ''.join(related))
+        related = CALLED_FROM_SECTION_RE.findall(content)
+        related_list = SYMBOL_ITEM_RE.findall(''.join(related))
 
         return list(set(deps_list)), list(set(related_list))
 
@@ -420,7 +564,18 @@ Example: void InitPostgres(const char *in_dbname, Oid dboid, const char *usernam
         print(f"Completed Batches: {self.stats['processed_batches']}/{self.stats['total_batches']}")
 
 def main():
-    orchestrator = DocumentationOrchestrator()
+    parser = argparse.ArgumentParser(
+        description='Generate documentation of PostgreSQL symbols batch by batch with Claude Code'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='Number of batches of the same layer processed concurrently (default: 1)'
+    )
+    args = parser.parse_args()
+
+    orchestrator = DocumentationOrchestrator(jobs=args.jobs)
     print("PostgreSQL Documentation Generation Orchestrator (ID-based)")
     print("=" * 60)
     orchestrator.process_all_batches()
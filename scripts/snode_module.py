@@ -22,6 +22,8 @@ class DatabaseConnection:
     """
     _instance = None
     _connection = None
+    # Open the database read-only (set before the first connection; allows several processes at once)
+    read_only = False
     
     def __new__(cls):
         if cls._instance is None:
@@ -33,7 +35,7 @@ class DatabaseConnection:
         if self._connection is None:
             if not Path(DB_FILE).exists():
                 raise FileNotFoundError(f"Database file '{DB_FILE}' not found.")
-            self._connection = duckdb.connect(DB_FILE, read_only=False)
+            self._connection = duckdb.connect(DB_FILE, read_only=self.read_only)
         return self._connection
     
     def close(self):
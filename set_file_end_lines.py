@@ -205,11 +205,11 @@ def main():
     
     try:
         # Check table existence
-        table_exists = conn.execute(f"""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_name = '{TABLE_NAME}'
-        """).fetchone()[0]
+        table_exists = conn.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.tables
+            WHERE table_name = ?
+        """, [TABLE_NAME]).fetchone()[0]
         
         if not table_exists:
             print(f"Error: Table '{TABLE_NAME}' not found in database.", file=sys.stderr)